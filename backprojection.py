@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Max abs difference from transformer.inverse_radon on the normalized output. Both paths
+# sample the same bilinear smear; on the example phantoms the observed difference is ~1e-13.
+tolerance = 1e-9
+default_checkpoints = 20
+
+
+def crop_grid(dim, output_size, dtype=float):
+    start = (dim - output_size) // 2
+    center = dim / 2.0 - 0.5
+    axis = (np.arange(start, start + output_size) - center).astype(dtype)
+    return axis.reshape(-1, 1), axis.reshape(1, -1), center
+
+
+def smear_profile(tomograph, row):
+    # detector row padded with zeros on both sides, matches rotate(mode='constant', cval=0)
+    profile = np.zeros(tomograph.dim + 2, dtype=tomograph.dtype)
+    profile[np.asarray(tomograph.indexes) + 1] = row
+    return profile
+
+
+def interpolate_profile(profile, positions):
+    # same as np.interp(positions, np.arange(-1, len(profile) - 1), profile), but keeps the profile's dtype
+    positions = np.clip(positions + 1, 0, len(profile) - 1)
+    lower = positions.astype(np.intp)
+    np.minimum(lower, len(profile) - 2, out=lower)
+    positions -= lower
+    values = profile[lower]
+    result = profile[lower + 1] - values
+    result *= positions
+    result += values
+    return result
+
+
+def add_backprojection(accumulator, row, rotation, tomograph, grid):
+    y, x, center = grid
+    dim = tomograph.dim
+    rad = np.deg2rad(rotation + 90)
+    # python floats, so float32 grids are not promoted to float64
+    cos, sin = float(np.cos(rad)), float(np.sin(rad))
+    detector = cos * x - sin * y + center
+    along = sin * x + cos * y + center
+    smear = interpolate_profile(smear_profile(tomograph, row), detector)
+    # rays fade out within one pixel outside the rotated square: np.interp(along, [-1, 0, dim-1, dim], [0, 1, 1, 0])
+    inside = np.clip(np.minimum(along + 1, dim - along), 0, 1)
+    smear *= inside
+    accumulator += smear
+
+
+def inverse_radon_interpolated(sigmoid, rotations, output_size, tomograph, on_change=None, out=None):
+    grid = crop_grid(tomograph.dim, output_size, tomograph.dtype)
+    result = np.zeros((output_size, output_size), dtype=tomograph.dtype) if out is None else out
+    for i, rotation in enumerate(rotations):
+        add_backprojection(result, sigmoid[i], rotation, tomograph, grid)
+        if on_change is not None:
+            on_change(isi=result, iter=i)
+    mat_min = result.min()
+    result -= mat_min
+    mat_max = result.max()
+    if mat_max > 0:
+        result /= mat_max
+    return result
+
+
+def split_evenly(items, parts):
+    return [items[i::parts] for i in range(parts) if len(items[i::parts]) > 0]
+
+
+def inverse_radon_threaded(sigmoid, rotations, output_size, tomograph, on_change=None, workers=None,
+                           checkpoints=default_checkpoints, out=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    grid = crop_grid(tomograph.dim, output_size, tomograph.dtype)
+    result = np.zeros((output_size, output_size), dtype=tomograph.dtype) if out is None else out
+    accumulators = [np.zeros((output_size, output_size), dtype=tomograph.dtype) for _ in range(workers)]
+
+    def accumulate(accumulator, angles):
+        for i in angles:
+            add_backprojection(accumulator, sigmoid[i], rotations[i], tomograph, grid)
+
+    step = max(1, int(np.ceil(len(rotations) / max(1, checkpoints))))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for begin in range(0, len(rotations), step):
+            end = min(begin + step, len(rotations))
+            parts = split_evenly(list(range(begin, end)), workers)
+            list(executor.map(accumulate, accumulators, parts))
+            for accumulator in accumulators:
+                result += accumulator
+                accumulator.fill(0)
+            if on_change is not None:
+                on_change(isi=result, iter=end - 1)
+    mat_min = result.min()
+    result -= mat_min
+    mat_max = result.max()
+    if mat_max > 0:
+        result /= mat_max
+    return result
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+import transformer as tr
+
+image_extensions = (".jpg", ".jpeg", ".png", ".bmp")
+dicom_extensions = (".dc3", ".dcm", ".dic")
+result_fields = ["image", "alpha", "emitters", "use_filter", "filter", "projection", "backprojection",
+                 "reconstruction", "dtype", "angles", "prepare_time", "project_time", "filter_time",
+                 "reconstruct_time", "total_time", "mse", "output", "error"]
+
+
+def find_images(patterns):
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            names = sorted(os.path.join(pattern, n) for n in os.listdir(pattern))
+        else:
+            names = sorted(glob.glob(pattern))
+        found.extend(n for n in names if n.lower().endswith(image_extensions + dicom_extensions))
+    return list(dict.fromkeys(found))
+
+
+def load_image(name):
+    if name.lower().endswith(dicom_extensions):
+        import pydicom
+        return tr.normalize_img(pydicom.dcmread(name, force=True).pixel_array.astype(float))
+    return None
+
+
+def make_jobs(args):
+    grid = itertools.product(find_images(args.images), args.alpha, args.emitters, args.filter,
+                             args.projection, args.backprojection, args.reconstruction, args.dtype)
+    return [dict(index=i, image=image, alpha=alpha, emitters=emitters, filter=filter_name, projection=projection,
+                 backprojection=backprojection, reconstruction=reconstruction, dtype=dtype,
+                 use_filter=not args.no_filter, use_omega=args.omega, output_dir=args.output_dir)
+            for i, (image, alpha, emitters, filter_name, projection, backprojection, reconstruction, dtype)
+            in enumerate(grid)]
+
+
+def output_name(job):
+    stem = os.path.splitext(os.path.basename(job["image"]))[0]
+    return os.path.join(job["output_dir"], "%s-%04d.npy" % (stem, job["index"]))
+
+
+def run_job(job):
+    result = {key: job.get(key) for key in ("image", "alpha", "emitters", "use_filter", "filter", "projection",
+                                            "backprojection", "reconstruction", "dtype")}
+    try:
+        params = tr.Parameters(job["alpha"], job["emitters"], job["use_filter"], job["image"])
+        params.set_values(job["alpha"], job["emitters"], job["use_filter"], job["image"],
+                          use_omega=job["use_omega"], projection=job["projection"],
+                          backprojection=job["backprojection"], filter_name=job["filter"],
+                          reconstruction=job["reconstruction"], dtype=job["dtype"])
+        timings = {}
+        start = time.perf_counter()
+        image, sinogram, _, i_sin = tr.run_pipeline(params, load_image(job["image"]), timings)
+        result["total_time"] = time.perf_counter() - start
+        for stage, seconds in timings.items():
+            result[stage + "_time"] = seconds
+        result["angles"] = len(sinogram)
+        result["mse"] = tr.get_medium_squared_error(image, i_sin)
+        if job["output_dir"]:
+            result["output"] = output_name(job)
+            np.save(result["output"], i_sin)
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+        traceback.print_exc()
+    return result
+
+
+class ResultWriter:
+
+    def __init__(self, csv_path=None, json_path=None) -> None:
+        self.csv_file = open(csv_path, "w", newline="") if csv_path else None
+        self.csv = None
+        if self.csv_file is not None:
+            self.csv = csv.DictWriter(self.csv_file, fieldnames=result_fields)
+            self.csv.writeheader()
+        self.json_file = open(json_path, "w") if json_path else None
+
+    def write(self, result):
+        if self.csv is not None:
+            self.csv.writerow({key: result.get(key) for key in result_fields})
+            self.csv_file.flush()
+        if self.json_file is not None:
+            self.json_file.write(json.dumps(result) + "\n")
+            self.json_file.flush()
+
+    def close(self):
+        for file in (self.csv_file, self.json_file):
+            if file is not None:
+                file.close()
+
+
+def run_batch(jobs, workers, writer):
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = [executor.submit(run_job, job) for job in jobs]
+        for done, task in enumerate(as_completed(tasks), 1):
+            result = task.result()
+            writer.write(result)
+            results.append(result)
+            print("[%d/%d] %s alpha=%s emitters=%s filter=%s mse=%s time=%s %s" % (
+                done, len(jobs), os.path.basename(result["image"]), result["alpha"], result["emitters"],
+                result["filter"], result.get("mse"), result.get("total_time"), result.get("error") or ""))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Radon transform parameter sweeps")
+    parser.add_argument("images", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("--alpha", nargs="+", type=float, default=[tr.params.alpha])
+    parser.add_argument("--emitters", nargs="+", type=int, default=[tr.params.emitters_num])
+    parser.add_argument("--filter", nargs="+", default=["ram-lak"], choices=sorted(tr.windows))
+    parser.add_argument("--projection", nargs="+", default=["rotate"], choices=sorted(tr.projection_engines))
+    parser.add_argument("--backprojection", nargs="+", default=["rotate"],
+                        choices=sorted(tr.backprojection_engines))
+    parser.add_argument("--reconstruction", nargs="+", default=["fbp"], choices=list(tr.reconstruction_methods))
+    parser.add_argument("--dtype", nargs="+", default=["float64"], choices=sorted(tr.precisions))
+    parser.add_argument("--no-filter", action="store_true", help="skip sinogram filtering")
+    parser.add_argument("--omega", action="store_true", help="multiply the filter by cos(omega)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="parallel processes")
+    parser.add_argument("--csv", help="stream results to this CSV file")
+    parser.add_argument("--json", help="stream results to this JSON lines file")
+    parser.add_argument("--output-dir", help="save reconstructions as .npy files here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = make_jobs(args)
+    if not jobs:
+        print("No images found")
+        return 1
+    writer = ResultWriter(args.csv, args.json)
+    try:
+        results = run_batch(jobs, args.jobs, writer)
+    finally:
+        writer.close()
+    return 1 if any(r.get("error") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import numpy as np
+from scipy.ndimage import map_coordinates
+from skimage.transform import rotate
+
+default_memory_budget = 64 * 2 ** 20
+bytes_per_sample = 6 * 8
+
+
+def detector_samples(tomograph):
+    # after rotating forth by (r + 90) and back by -(r + 180) the mask is always turned by -90,
+    # so the weights seen along every detector row do not depend on the angle
+    mask = rotate(tomograph.tomograph, -90)[tomograph.indexes]
+    detectors, columns = np.nonzero(mask)
+    return detectors, columns, mask[detectors, columns]
+
+
+def angles_per_chunk(samples_num, memory_budget):
+    return int(max(1, memory_budget // max(1, samples_num * bytes_per_sample)))
+
+
+def make_radon_batched(increased_image, tomograph, real_dim, theta, on_change=None,
+                       memory_budget=default_memory_budget, out=None):
+    detectors, columns, weights = detector_samples(tomograph)
+    dtype = tomograph.dtype
+    center = tomograph.dim / 2.0 - 0.5
+    y = (np.asarray(tomograph.indexes)[detectors] - center).astype(dtype)
+    x = (columns - center).astype(dtype)
+    weights = weights / dtype.type(real_dim)
+    width = tomograph.width
+    angles = np.asarray(theta, dtype=float)
+    chunk = angles_per_chunk(len(detectors), memory_budget)
+    res = np.zeros((len(angles), width), dtype=dtype) if out is None else out
+    for begin in range(0, len(angles), chunk):
+        end = min(begin + chunk, len(angles))
+        rad = np.deg2rad(-angles[begin:end] - 180).reshape(-1, 1)
+        cos, sin = np.cos(rad).astype(dtype), np.sin(rad).astype(dtype)
+        coords = np.empty((2, end - begin, len(detectors)), dtype=dtype)
+        coords[0] = sin * x + cos * y + center
+        coords[1] = cos * x - sin * y + center
+        values = map_coordinates(increased_image, coords, order=1, mode='constant', cval=0.0)
+        values *= weights
+        bins = detectors + width * np.arange(end - begin).reshape(-1, 1)
+        res[begin:end] = np.bincount(bins.ravel(), weights=values.ravel(),
+                                     minlength=(end - begin) * width).reshape(-1, width)
+        if on_change is not None:
+            on_change(si=res, iter=end - 1)
+    return res
@@ -0,0 +1,171 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from multiprocessing import get_context
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+import dicom_creator
+import transformer as tr
+
+default_results = "benchmark_results.json"
+default_images = ["Shepp_logan.jpg", "Kwadraty2.jpg", "CT_ScoutView.jpg"]
+default_scales = [0.1, 0.2]
+default_alphas = [2.0, 1.0]
+default_emitters = [50, 100]
+default_threshold = 0.2
+min_regression_seconds = 0.005
+dicom_batch = 16
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def timed(function, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, times[0], min(times)
+
+
+def run_case(case):
+    # every case runs in a fresh process, so peak RSS is not inherited from earlier cases
+    dtype = tr.precisions[case["dtype"]]
+    image = tr.read_image(os.path.join(tr.img_name_root, case["image"]), case["scale"])
+    image = tr.make_image_square(image.astype(dtype))
+    theta = tr.get_moves(case["alpha"])
+    increased_image = tr.increase_image(image)
+    repeat = case["repeat"]
+    records = []
+
+    def record(stage, engine, cold, best, mse=None, **extra):
+        records.append(dict(case, stage=stage, engine=engine, cold_time=cold, time=best,
+                            peak_rss_mb=peak_rss_mb(), mse=mse, **extra))
+
+    tomograph, cold, best = timed(lambda: tr.Tomograph(emitters=case["emitters"], dim=np.max(image.shape),
+                                                       dtype=dtype), repeat)
+    record("tomograph", "default", cold, best)
+    sinograms = {}
+    for engine in case["projection"]:
+        params = tr.Parameters(case["alpha"], case["emitters"], True, case["image"], projection=engine,
+                               dtype=case["dtype"])
+        sinograms[engine], cold, best = timed(
+            lambda: tr.project(params, increased_image, tomograph, len(image), theta), repeat)
+        record("make_radon", engine, cold, best)
+    sinogram = sinograms.get("rotate", next(iter(sinograms.values())))
+    params = tr.Parameters(case["alpha"], case["emitters"], True, case["image"], dtype=case["dtype"])
+    filtered, cold, best = timed(lambda: tr.transform_sinogram(params, sinogram), repeat)
+    record("transform_sinogram", params.filter_name, cold, best)
+    for engine in case["backprojection"]:
+        params = tr.Parameters(case["alpha"], case["emitters"], True, case["image"], backprojection=engine,
+                               dtype=case["dtype"])
+        i_sin, cold, best = timed(
+            lambda: tr.back_project(params, np.array(filtered), theta, len(image), tomograph), repeat)
+        record("inverse_radon", engine, cold, best, tr.get_medium_squared_error(image, i_sin))
+    params = tr.Parameters(case["alpha"], case["emitters"], True, case["image"], reconstruction="fourier",
+                           dtype=case["dtype"])
+    direct, cold, best = timed(lambda: tr.reconstruct_direct(params, sinogram, theta, len(image), tomograph), repeat)
+    record("direct_fourier", params.filter_name, cold, best, tr.get_medium_squared_error(image, direct))
+    slices = [i_sin] * dicom_batch
+    _, cold, best = timed(lambda: [dicom_creator.encode(ds) for ds in dicom_creator.create_series(slices)], repeat)
+    record("dicom_series", "memory", cold, best, slices_per_second=dicom_batch / best)
+    return records
+
+
+def case_key(record):
+    # baselines written before the dtype policy are float64 runs
+    record = dict(record, dtype=record.get("dtype", "float64"))
+    return "|".join(str(record[k]) for k in ("image", "scale", "alpha", "emitters", "dtype", "stage", "engine"))
+
+
+def compare(results, baseline, threshold):
+    reference = {case_key(r): r for r in baseline["records"]}
+    regressions = []
+    for record in results["records"]:
+        old = reference.get(case_key(record))
+        if old is None:
+            continue
+        if record["time"] > old["time"] * (1 + threshold) and \
+                record["time"] - old["time"] > min_regression_seconds:
+            regressions.append((case_key(record), old["time"], record["time"]))
+    return regressions
+
+
+def make_cases(args):
+    grid = itertools.product(args.images, args.scales, args.alpha, args.emitters, args.dtype)
+    return [dict(image=image, scale=scale, alpha=alpha, emitters=emitters, dtype=dtype, repeat=args.repeat,
+                 projection=args.projection, backprojection=args.backprojection)
+            for image, scale, alpha, emitters, dtype in grid]
+
+
+def run_benchmark(cases):
+    records = []
+    with get_context().Pool(processes=1, maxtasksperchild=1) as pool:
+        for i, case_records in enumerate(pool.imap(run_case, cases), 1):
+            records.extend(case_records)
+            for r in case_records:
+                print("[%d/%d] %s scale=%s alpha=%s emitters=%s %s %s/%s %.4fs (cold %.4fs) rss=%.0fMB%s%s" % (
+                    i, len(cases), r["image"], r["scale"], r["alpha"], r["emitters"], r["dtype"], r["stage"],
+                    r["engine"],
+                    r["time"], r["cold_time"], r["peak_rss_mb"],
+                    "" if r["mse"] is None else " mse=%.5f" % r["mse"],
+                    " %.0f slices/s" % r["slices_per_second"] if "slices_per_second" in r else ""))
+    return dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                processor=platform.processor(), cpus=os.cpu_count(), created=time.time(), records=records)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark projection, filtering and reconstruction")
+    parser.add_argument("--images", nargs="+", default=default_images)
+    parser.add_argument("--scales", nargs="+", type=float, default=default_scales)
+    parser.add_argument("--alpha", nargs="+", type=float, default=default_alphas)
+    parser.add_argument("--emitters", nargs="+", type=int, default=default_emitters)
+    parser.add_argument("--dtype", nargs="+", default=["float64"], choices=sorted(tr.precisions))
+    parser.add_argument("--projection", nargs="+", default=["rotate", "sparse", "batched", "siddon"],
+                        choices=sorted(tr.projection_engines))
+    parser.add_argument("--backprojection", nargs="+",
+                        default=["rotate", "interpolate", "threaded", "hierarchical", "siddon"],
+                        choices=sorted(tr.backprojection_engines))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=default_results, help="where to write the results JSON")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", help="also store the results as a new baseline here")
+    parser.add_argument("--threshold", type=float, default=default_threshold,
+                        help="allowed relative slowdown before a case counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(make_cases(args))
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as file:
+            json.dump(results, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for key, old, new in regressions:
+            print("REGRESSION %s: %.4fs -> %.4fs" % (key, old, new))
+        if regressions:
+            return 1
+        print("No regressions against", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
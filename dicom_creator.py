@@ -1,85 +1,133 @@
-import os
-import tempfile
+import copy
 import datetime
-import traceback
+import os
+from io import BytesIO
+
 import matplotlib.pyplot as plt
+import numpy as np
 import pydicom
-from PIL import Image
 from pydicom.dataset import Dataset, FileDataset
-from pydicom.filewriter import correct_ambiguous_vr
+from pydicom.uid import ExplicitVRLittleEndian, PYDICOM_IMPLEMENTATION_UID, generate_uid
 
 from transformer import read_image
 
+ct_image_storage = '1.2.840.10008.5.1.4.1.1.2'
+pixel_type = np.uint16
+# pixel data and anything else that depends on the source pixels is replaced, not copied
+skipped_keywords = {"NumberOfFrames", "SmallestImagePixelValue", "LargestImagePixelValue",
+                    "WindowCenter", "WindowWidth", "RescaleIntercept", "RescaleSlope"}
+
+
+def to_pixels(image):
+    # floats are treated as intensities in [0, 1], integers are only clipped to the stored range
+    image = np.asarray(image)
+    limit = np.iinfo(pixel_type).max
+    if np.issubdtype(image.dtype, np.floating):
+        return (np.clip(image, 0, 1) * limit + 0.5).astype(pixel_type)
+    return np.clip(image, 0, limit).astype(pixel_type)
+
+
+def copy_header(template):
+    header = Dataset()
+    for element in template:
+        if element.tag.group != 0x7FE0 and element.keyword not in skipped_keywords:
+            header.add(copy.deepcopy(element))
+    return header
 
-def create_dcm_file(image):
-    # Create some temporary filenames
-    suffix = '.dcm'
-    filename_little_endian = tempfile.NamedTemporaryFile(suffix=suffix).name
 
-    print("Setting file meta information...")
-    # Populate required values for file meta information
+def make_file_meta(sop_instance_uid, sop_class_uid=ct_image_storage):
     file_meta = Dataset()
-    file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
-    file_meta.MediaStorageSOPInstanceUID = "1.2.3"
-    file_meta.ImplementationClassUID = "1.2.3.4"
-
-    print("Setting dataset values...")
-    # Create the FileDataset instance (initially no data elements, but file_meta
-    # supplied)
-    ds = FileDataset(filename_little_endian, {},
-                     file_meta=file_meta, preamble=b"\0" * 128)
-
-    # Add the data elements -- not trying to set all required here. Check DICOM
-    # standard
-    ds.PatientName = ""
-    ds.PatientID = ""
-    ds.PixelRepresentation = 1
-    # Set the transfer syntax
-    ds.is_little_endian = True
-    ds.is_implicit_VR = False
+    file_meta.MediaStorageSOPClassUID = sop_class_uid
+    file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    file_meta.ImplementationClassUID = PYDICOM_IMPLEMENTATION_UID
+    return file_meta
+
+
+def create_dataset(image, template=None, series_uid=None, study_uid=None, instance_number=1,
+                   description=None, filename=""):
+    header = Dataset() if template is None else copy_header(template)
+    sop_class_uid = header.get("SOPClassUID", ct_image_storage)
+    sop_instance_uid = generate_uid()
+    ds = FileDataset(filename, header, file_meta=make_file_meta(sop_instance_uid, sop_class_uid),
+                     preamble=b"\0" * 128)
+    ds.SOPClassUID = sop_class_uid
+    ds.SOPInstanceUID = sop_instance_uid
+    ds.StudyInstanceUID = study_uid or header.get("StudyInstanceUID") or generate_uid()
+    ds.SeriesInstanceUID = series_uid or generate_uid()
+    ds.InstanceNumber = instance_number
+    if "Modality" not in ds:
+        ds.Modality = "CT"
+    if "PatientName" not in ds:
+        ds.PatientName = ""
+    if "PatientID" not in ds:
+        ds.PatientID = ""
+    if description is not None:
+        ds.SeriesDescription = description
+    now = datetime.datetime.now()
+    ds.ContentDate = now.strftime('%Y%m%d')
+    ds.ContentTime = now.strftime('%H%M%S.%f')
+    set_pixels(ds, image)
+    return ds
+
+
+def set_pixels(ds, image):
+    pixels = to_pixels(image)
+    ds.Rows, ds.Columns = pixels.shape
     ds.SamplesPerPixel = 1
     ds.PhotometricInterpretation = "MONOCHROME2"
-    ds.PixelRepresentation = 1
-    ds.HighBit = 15
-    ds.BitsStored = 16
     ds.BitsAllocated = 16
-    ds.SmallestImagePixelValue = str.encode('\x00\x00')
-    ds.LargestImagePixelValue = str.encode('\xff\xff')
-    ds.Columns = image.shape[0]
-    ds.Rows = image.shape[1]    # Set creation date/time
-    dt = datetime.datetime.now()
-    ds.ContentDate = dt.strftime('%Y%m%d')
-    timeStr = dt.strftime('%H%M%S.%f')  # long format with micro seconds
-    ds.ContentTime = timeStr
-    try:
-        if image.max() <= 1:
-            image *= 255
-            image = image.astype("uint16")
-        ds.PixelData = Image.fromarray(image).tobytes()
-    except Exception:
-        traceback.print_exc()
-    print("Writing test file", filename_little_endian)
-    ds.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
-    ds = correct_ambiguous_vr(ds, True)
-    ds.save_as(filename_little_endian)
-    print("File saved.")
-
-    print("File saved.")
-    print('Load file {} ...'.format(filename_little_endian))
-    ds = pydicom.dcmread(filename_little_endian)
-    print('Remove file {} ...'.format(filename_little_endian))
-    os.remove(filename_little_endian)
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.SmallestImagePixelValue = int(pixels.min())
+    ds.LargestImagePixelValue = int(pixels.max())
+    ds.PixelData = np.ascontiguousarray(pixels, dtype='<u2').tobytes()
     return ds
 
 
+def create_dcm_file(image):
+    return create_dataset(image)
+
+
+def encode(ds):
+    buffer = BytesIO()
+    ds.save_as(buffer)
+    return buffer.getvalue()
+
+
+def decode(data):
+    return pydicom.dcmread(BytesIO(data), force=True)
+
+
+def create_series(images, templates=None, description=None):
+    # one study/series uid pair shared by every slice, instance numbers follow the image order
+    if templates is None:
+        templates = [None] * len(images)
+    first = templates[0] if len(templates) > 0 else None
+    study_uid = first.get("StudyInstanceUID") if first is not None else None
+    study_uid = study_uid or generate_uid()
+    series_uid = generate_uid()
+    return [create_dataset(image, template, series_uid, study_uid, i, description)
+            for i, (image, template) in enumerate(zip(images, templates), 1)]
+
+
+def write_series(images, output_dir, templates=None, description=None, prefix="slice"):
+    os.makedirs(output_dir, exist_ok=True)
+    names = []
+    for ds in create_series(images, templates, description):
+        name = os.path.join(output_dir, "%s-%04d.dcm" % (prefix, ds.InstanceNumber))
+        ds.filename = name
+        ds.save_as(name)
+        names.append(name)
+    return names
+
+
 if __name__ == '__main__':
     image = read_image("./examples/Kropka.jpg")
-    dcm = create_dcm_file(image)
     file_name = "dcm.dcm"
-    pydicom.filewriter.write_file(file_name, dcm)  # extension required
-    # dcm.save_as(file_name)
+    create_dcm_file(image).save_as(file_name)
     ds = pydicom.dcmread(file_name)
     array = ds.pixel_array
     plt.imshow(array)
     plt.show()
-
@@ -0,0 +1,60 @@
+from functools import lru_cache
+
+import numpy as np
+from numpy.fft import rfft, irfft, rfftfreq
+
+
+def ram_lak(f):
+    return np.ones_like(f)
+
+
+def shepp_logan(f):
+    return np.sinc(f)
+
+
+def cosine(f):
+    return np.cos(np.pi * f)
+
+
+def hamming(f):
+    return 0.54 + 0.46 * np.cos(2 * np.pi * f)
+
+
+def hann(f):
+    return 0.5 + 0.5 * np.cos(2 * np.pi * f)
+
+
+windows = {
+    "ram-lak": ram_lak,
+    "shepp-logan": shepp_logan,
+    "cosine": cosine,
+    "hamming": hamming,
+    "hann": hann,
+}
+
+
+def padded_size(detectors):
+    return max(64, int(2 ** np.ceil(np.log2(2 * detectors))))
+
+
+@lru_cache(maxsize=64)
+def filter_response(size, name="ram-lak", use_omega=False):
+    if name not in windows:
+        raise Exception("Unknown filter " + str(name))
+    f = rfftfreq(size)
+    response = 2 * np.abs(f) * windows[name](f)
+    if use_omega:
+        response *= np.cos(2 * np.pi * f)
+    response.setflags(write=False)
+    return response
+
+
+def filter_sinograms(sinograms, name="ram-lak", use_omega=False):
+    # filters along the last (detector) axis, any leading axes are treated as a batch
+    sinograms = np.asarray(sinograms)
+    detectors = sinograms.shape[-1]
+    size = padded_size(detectors)
+    projection = rfft(sinograms, n=size, axis=-1)
+    # float32 sinograms give complex64 spectra, the cached float64 response must not promote them
+    projection *= filter_response(size, name, use_omega).astype(projection.real.dtype, copy=False)
+    return irfft(projection, n=size, axis=-1)[..., :detectors]
@@ -0,0 +1,113 @@
+from functools import lru_cache
+
+import numpy as np
+from numpy.fft import fft, fftfreq, fftshift, ifft2, ifftshift
+from scipy.special import i0
+
+from filter_bank import filter_response, padded_size
+
+default_oversampling = 2
+default_kernel_width = 4
+
+
+def kaiser_bessel_beta(width, oversampling):
+    # Beatty et al. 2005, minimal aliasing for the given kernel width and grid oversampling
+    return np.pi * np.sqrt((width / oversampling) ** 2 * (oversampling - 0.5) ** 2 - 0.8)
+
+
+def kaiser_bessel(distance, width, beta):
+    inside = np.abs(distance) < width / 2
+    argument = np.sqrt(np.clip(1 - (2 * distance / width) ** 2, 0, None))
+    return np.where(inside, i0(beta * argument), 0.0)
+
+
+def grid_samples(u, v, values, size, width, beta):
+    # convolve the polar samples with the kernel onto a (size, size) cartesian grid, u along columns
+    column = u * size + size / 2
+    row = v * size + size / 2
+    first_column = np.floor(column - width / 2).astype(np.int64) + 1
+    first_row = np.floor(row - width / 2).astype(np.int64) + 1
+    columns = [(first_column + dx) % size for dx in range(width)]
+    column_weights = [kaiser_bessel(first_column + dx - column, width, beta) for dx in range(width)]
+    real = np.zeros(size * size)
+    imag = np.zeros(size * size)
+    for dy in range(width):
+        rows = first_row + dy
+        row_values = values * kaiser_bessel(rows - row, width, beta)
+        rows = (rows % size) * size
+        for dx in range(width):
+            weighted = row_values * column_weights[dx]
+            bins = rows + columns[dx]
+            real += np.bincount(bins, weights=weighted.real, minlength=size * size)
+            imag += np.bincount(bins, weights=weighted.imag, minlength=size * size)
+    return (real + 1j * imag).reshape(size, size)
+
+
+@lru_cache(maxsize=16)
+def deapodization(size, width, beta):
+    # image of a single unit sample at the origin, dividing by it undoes the kernel's apodization
+    kernel = grid_samples(np.zeros(1), np.zeros(1), np.ones(1, dtype=complex), size, width, beta)
+    correction = fftshift(ifft2(ifftshift(kernel))).real
+    correction.setflags(write=False)
+    return correction
+
+
+def angular_weights(rotations):
+    # half the distance to both neighbours, angles wrap around after 180 degrees
+    angles = np.asarray(rotations, dtype=float) % 180
+    if len(angles) < 2:
+        return np.ones(len(angles))
+    order = np.argsort(angles)
+    ordered = angles[order]
+    gaps = np.diff(np.concatenate([ordered, [ordered[0] + 180]]))
+    weights = np.empty(len(angles))
+    weights[order] = (gaps + np.roll(gaps, 1)) / 2
+    return weights / weights.mean()
+
+
+def detector_geometry(tomograph):
+    indexes = np.asarray(tomograph.indexes, dtype=float)
+    spacing = indexes[1] - indexes[0] if len(indexes) > 1 else 1.0
+    return indexes[0] - (tomograph.dim / 2.0 - 0.5), spacing
+
+
+def reconstruct_fourier(sinogram, rotations, output_size, tomograph, on_change=None, use_filter=True,
+                        filter_name="ram-lak", use_omega=False, oversampling=default_oversampling,
+                        kernel_width=default_kernel_width, out=None):
+    # Fourier slice theorem: 1-D FFT of every projection is a radial line of the image's 2-D spectrum,
+    # the lines are gridded with a Kaiser-Bessel kernel and the image is one inverse 2-D FFT away
+    sinogram = np.asarray(sinogram, dtype=float)
+    first_detector, spacing = detector_geometry(tomograph)
+    size = padded_size(tomograph.width)
+    projections = fft(sinogram, n=size, axis=1)
+    frequency = fftfreq(size)
+    if use_filter:
+        # density compensation of the polar samples is the ramp filter, windowed like in FBP
+        projections *= filter_response(size, filter_name, use_omega)[np.abs(np.rint(frequency * size)).astype(int)]
+    projections *= angular_weights(rotations).reshape(-1, 1)
+    omega = frequency / spacing
+    # output pixel j sits at (j + shift) pixels from the tomograph's centre, grid origin is output pixel N // 2
+    start = (tomograph.dim - output_size) // 2
+    shift = start - (tomograph.dim / 2.0 - 0.5) + output_size // 2
+    rad = np.deg2rad(np.asarray(rotations, dtype=float) + 90).reshape(-1, 1)
+    u = np.cos(rad) * omega
+    v = -np.sin(rad) * omega
+    projections *= np.exp(-2j * np.pi * omega * first_detector) * np.exp(2j * np.pi * shift * (u + v))
+    inside = (np.abs(u) <= 0.5) & (np.abs(v) <= 0.5)
+    grid_size = int(np.ceil(oversampling * output_size / 2)) * 2
+    beta = kaiser_bessel_beta(kernel_width, oversampling)
+    spectrum = grid_samples(u[inside], v[inside], projections[inside], grid_size, kernel_width, beta)
+    image = fftshift(ifft2(ifftshift(spectrum))).real
+    begin = grid_size // 2 - output_size // 2
+    image = image[begin:begin + output_size, begin:begin + output_size]
+    image /= deapodization(grid_size, kernel_width, beta)[begin:begin + output_size, begin:begin + output_size]
+    # the spectrum is gridded with np.bincount, which only accumulates float64; the result follows the tomograph
+    result = np.zeros((output_size, output_size), dtype=tomograph.dtype) if out is None else out
+    result[...] = image
+    result -= result.min()
+    result_max = result.max()
+    if result_max > 0:
+        result /= result_max
+    if on_change is not None:
+        on_change(isi=result, iter=len(rotations) - 1)
+    return result
@@ -0,0 +1,127 @@
+import numpy as np
+
+# Max angular smear, in pixels, allowed when two neighbouring angles are merged into one.
+# Smaller is closer to inverse_radon, larger merges angles earlier and runs faster.
+default_tolerance = 0.5
+leaf_size = 32
+
+
+def sample_rows(rows, positions):
+    # linear interpolation of every row at its own fractional positions, zero outside the row
+    padded = np.pad(rows, ((0, 0), (1, 1)))
+    positions = np.clip(positions + 1, 0, padded.shape[1] - 1)
+    lower = np.minimum(np.floor(positions).astype(np.int64), padded.shape[1] - 2)
+    fraction = (positions - lower).astype(rows.dtype, copy=False)
+    lower_values = np.take_along_axis(padded, lower, axis=1)
+    upper_values = np.take_along_axis(padded, lower + 1, axis=1)
+    return lower_values + (upper_values - lower_values) * fraction
+
+
+class Projections:
+    # filtered rows with angles; row m sample k sits at starts[m] + k * step from the region centre
+
+    def __init__(self, rows, starts, step, cos, sin) -> None:
+        self.rows = rows
+        self.starts = starts
+        self.step = step
+        self.cos = cos
+        self.sin = sin
+
+    def __len__(self):
+        return len(self.cos)
+
+    def recentred(self, dy, dx, radius):
+        # move the origin by (dy, dx) and keep only samples within radius, whole samples so nothing is resampled
+        starts = self.starts - (self.cos * dx - self.sin * dy)
+        count = int(np.ceil(2 * radius / self.step)) + 2
+        first = np.floor((-radius - starts) / self.step).astype(np.int64)
+        indexes = first.reshape(-1, 1) + np.arange(count)
+        valid = (indexes >= 0) & (indexes < self.rows.shape[1])
+        rows = np.where(valid, np.take_along_axis(self.rows, np.clip(indexes, 0, self.rows.shape[1] - 1), axis=1), 0)
+        return Projections(rows, starts + first * self.step, self.step, self.cos, self.sin)
+
+    def max_gap(self):
+        if len(self) < 2:
+            return np.inf
+        angles = np.arctan2(self.sin, self.cos)
+        return np.max(np.abs(np.angle(np.exp(1j * (angles[1::2] - angles[:-1:2])))))
+
+    def decimated(self):
+        # neighbouring angles are summed onto the grid of the first one at their mean direction
+        first, second = slice(0, len(self) - 1, 2), slice(1, len(self), 2)
+        rows = self.rows[first] + sample_rows(
+            self.rows[second], ((self.starts[first] - self.starts[second]) / self.step).reshape(-1, 1) +
+            np.arange(self.rows.shape[1]))
+        cos = self.cos[first] + self.cos[second]
+        sin = self.sin[first] + self.sin[second]
+        norm = np.hypot(cos, sin)
+        merged = Projections(rows, self.starts[first], self.step, cos / norm, sin / norm)
+        if len(self) % 2 == 0:
+            return merged
+        last = slice(len(self) - 1, len(self))
+        return Projections(np.concatenate([merged.rows, self.rows[last]]),
+                           np.concatenate([merged.starts, self.starts[last]]), self.step,
+                           np.concatenate([merged.cos, self.cos[last]]), np.concatenate([merged.sin, self.sin[last]]))
+
+
+def back_project_leaf(projections, result):
+    rows, columns = result.shape
+    y = np.arange(rows) - (rows - 1) / 2.0
+    x = np.arange(columns) - (columns - 1) / 2.0
+    detector = (projections.cos.reshape(-1, 1, 1) * x.reshape(1, 1, -1) -
+                projections.sin.reshape(-1, 1, 1) * y.reshape(1, -1, 1))
+    positions = (detector - projections.starts.reshape(-1, 1, 1)) / projections.step
+    result += sample_rows(projections.rows, positions.reshape(len(projections), -1)).sum(axis=0).reshape(rows, columns)
+
+
+def back_project_region(projections, result, tolerance):
+    rows, columns = result.shape
+    radius = np.hypot(rows, columns) / 2.0 + 1
+    while len(projections) > 1 and radius * projections.max_gap() / 2 <= tolerance * projections.step:
+        projections = projections.decimated()
+    if max(rows, columns) <= leaf_size:
+        back_project_leaf(projections, result)
+        return
+    for (top, bottom), (left, right) in quadrants(rows, columns):
+        dy = (top + bottom - 1) / 2.0 - (rows - 1) / 2.0
+        dx = (left + right - 1) / 2.0 - (columns - 1) / 2.0
+        part = result[top:bottom, left:right]
+        back_project_region(projections.recentred(dy, dx, np.hypot(*part.shape) / 2.0 + 1), part, tolerance)
+
+
+def quadrants(rows, columns):
+    row_ranges = [(0, rows // 2), (rows // 2, rows)] if rows > 1 else [(0, rows)]
+    column_ranges = [(0, columns // 2), (columns // 2, columns)] if columns > 1 else [(0, columns)]
+    return [(r, c) for r in row_ranges for c in column_ranges if r[1] > r[0] and c[1] > c[0]]
+
+
+def inverse_radon_hierarchical(sigmoid, rotations, output_size, tomograph, on_change=None,
+                               tolerance=default_tolerance, out=None):
+    # recursively splits the image into quadrants; smaller regions tolerate coarser angular sampling,
+    # so angles are merged pairwise on the way down and the total cost approaches O(N^2 log N).
+    # With tolerance=0 nothing is merged and the result matches inverse_radon except for the image
+    # corners, where inverse_radon also fades rays that leave the rotated square.
+    # rows are smeared like smear_profile, one sample per pixel with zeros between the detectors
+    profiles = np.zeros((len(rotations), tomograph.dim + 2), dtype=tomograph.dtype)
+    profiles[:, np.asarray(tomograph.indexes) + 1] = sigmoid
+    center = tomograph.dim / 2.0 - 0.5
+    # crop centre relative to the tomograph centre, same crop as crop_grid
+    offset = (tomograph.dim - output_size) // 2 + (output_size - 1) / 2.0 - center
+    rad = np.deg2rad(np.asarray(rotations, dtype=float) + 90)
+    projections = Projections(profiles, np.full(len(rotations), -1 - center), 1.0, np.cos(rad), np.sin(rad))
+    result = np.zeros((output_size, output_size), dtype=tomograph.dtype) if out is None else out
+    result[...] = 0
+    parts = quadrants(output_size, output_size)
+    for i, ((top, bottom), (left, right)) in enumerate(parts, 1):
+        dy = offset + (top + bottom - 1) / 2.0 - (output_size - 1) / 2.0
+        dx = offset + (left + right - 1) / 2.0 - (output_size - 1) / 2.0
+        part = result[top:bottom, left:right]
+        back_project_region(projections.recentred(dy, dx, np.hypot(*part.shape) / 2.0 + 1), part, tolerance)
+        if on_change is not None:
+            on_change(isi=result, iter=i * len(rotations) // len(parts) - 1)
+    mat_min = result.min()
+    result -= mat_min
+    mat_max = result.max()
+    if mat_max > 0:
+        result /= mat_max
+    return result
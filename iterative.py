@@ -0,0 +1,73 @@
+import numpy as np
+
+from system_matrix import system_matrices
+
+
+def ordered_subsets(angles_num, subsets):
+    subsets = max(1, min(subsets, angles_num))
+    return [np.arange(i, angles_num, subsets) for i in range(subsets)]
+
+
+def subset_rows(angles, width):
+    return (angles.reshape(-1, 1) * width + np.arange(width)).ravel()
+
+
+def inverse_sums(matrix, axis):
+    sums = np.asarray(matrix.sum(axis=axis)).ravel()
+    inverse = np.zeros_like(sums)
+    inverse[sums > 0] = 1 / sums[sums > 0]
+    return inverse
+
+
+def prepare_subsets(matrix, angles_num, width, subsets):
+    prepared = []
+    for angles in ordered_subsets(angles_num, subsets):
+        rows = subset_rows(angles, width)
+        sub_matrix = matrix[rows]
+        prepared.append((rows, sub_matrix, sub_matrix.T.tocsr(),
+                         inverse_sums(sub_matrix, 1), inverse_sums(sub_matrix, 0)))
+    return prepared
+
+
+def crop(image, dim, output_size):
+    start = (dim - output_size) // 2
+    return image.reshape(dim, dim)[start:start + output_size, start:start + output_size]
+
+
+def reconstruct_sart(sinogram, rotations, output_size, tomograph, on_change=None, iterations=10,
+                     subsets=10, relaxation=0.5, relaxation_decay=1.0, tolerance=1e-4,
+                     error_of=None, target_error=None, non_negative=True, matrix=None):
+    # SART over ordered subsets of angles; subsets == len(rotations) updates after every
+    # projection (ART by projection), subsets == 1 is plain SIRT-like SART.
+    # matrix defaults to the rotation system matrix, any (angles * width, dim^2) operator works
+    if matrix is None:
+        matrix = system_matrices.get(tomograph, rotations, output_size)
+    measured = np.ravel(sinogram).astype(tomograph.dtype, copy=False)
+    measured_norm = np.linalg.norm(measured) or 1
+    prepared = prepare_subsets(matrix, len(rotations), tomograph.width, subsets)
+    image = np.zeros(tomograph.dim * tomograph.dim, dtype=tomograph.dtype)
+    previous_residual = np.inf
+    step = relaxation
+    for iteration in range(iterations):
+        for rows, sub_matrix, sub_transposed, inverse_rows, inverse_columns in prepared:
+            correction = (measured[rows] - sub_matrix @ image) * inverse_rows
+            image += tomograph.dtype.type(step) * inverse_columns * (sub_transposed @ correction)
+            if non_negative:
+                np.maximum(image, 0, out=image)
+        step *= relaxation_decay
+        result = crop(image, tomograph.dim, output_size)
+        residual = np.linalg.norm(measured - matrix @ image) / measured_norm
+        if on_change is not None:
+            on_change(isi=result, iter=iteration)
+        if error_of is not None and target_error is not None and error_of(result) <= target_error:
+            break
+        if previous_residual - residual < tolerance:
+            break
+        previous_residual = residual
+    result = np.array(crop(image, tomograph.dim, output_size))
+    mat_min = result.min()
+    result -= mat_min
+    mat_max = result.max()
+    if mat_max > 0:
+        result /= mat_max
+    return result
@@ -0,0 +1,139 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+# scans spend most of their time in numpy, which already uses several cores per scan
+default_workers = max(1, (os.cpu_count() or 1) // 2)
+default_max_pending = 64
+
+
+class Cancelled(Exception):
+    pass
+
+
+class JobTimeout(Cancelled):
+    pass
+
+
+class NullPlot:
+    # plot interface for scans without a GUI
+
+    def get_display_shape(self):
+        return None
+
+    def on_new_scan(self, image, iterations):
+        pass
+
+    def on_sinogram(self, data):
+        pass
+
+    def on_isinogram(self, data):
+        pass
+
+
+class Job:
+    # handle of one submitted scan; the scanner calls check() between angles, which is where
+    # cancellation and the timeout take effect
+
+    def __init__(self, scanner, timeout=None) -> None:
+        self.scanner = scanner
+        self.timeout = timeout
+        self.cancel_event = Event()
+        self.future = None
+        self.deadline = None
+        self.started = None
+        self.finished = None
+
+    def run(self):
+        self.started = time.monotonic()
+        if self.timeout is not None:
+            self.deadline = self.started + self.timeout
+        try:
+            self.check()
+            self.scanner.watch_changes()
+            return self.scanner
+        finally:
+            self.finished = time.monotonic()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise Cancelled("Job was cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel_event.set()
+            raise JobTimeout("Job exceeded its %s s timeout" % self.timeout)
+
+    def cancel(self):
+        self.cancel_event.set()
+        # jobs still waiting in the queue never start, running ones stop at their next check
+        if self.future is not None:
+            self.future.cancel()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def progress(self):
+        return self.scanner.progress()
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (time.monotonic() if self.finished is None else self.finished) - self.started
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
+        return self.future.exception(timeout)
+
+    def add_done_callback(self, callback):
+        self.future.add_done_callback(lambda _: callback(self))
+
+
+class JobPool:
+    # bounded thread pool of scans; at most max_pending jobs may be queued or running at once
+
+    def __init__(self, workers=default_workers, max_pending=default_max_pending) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+        self.max_pending = max_pending
+        self.jobs = set()
+        self.lock = Lock()
+
+    def submit(self, scanner, timeout=None):
+        job = Job(scanner, timeout)
+        with self.lock:
+            if len(self.jobs) >= self.max_pending:
+                raise Exception("Job queue is full")
+            scanner.job = job
+            job.future = self.executor.submit(job.run)
+            self.jobs.add(job)
+        job.future.add_done_callback(lambda _: self.discard(job))
+        return job
+
+    def discard(self, job):
+        with self.lock:
+            self.jobs.discard(job)
+
+    def pending(self):
+        with self.lock:
+            return len(self.jobs)
+
+    def cancel_all(self):
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True, cancel=True):
+        if cancel:
+            self.cancel_all()
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
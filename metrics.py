@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+from scipy.ndimage import uniform_filter
+
+available_metrics = ("mse", "psnr", "ssim")
+ssim_window = 7
+ssim_k1 = 0.01
+ssim_k2 = 0.03
+
+
+def structural_similarity(first, second, data_range):
+    c1 = (ssim_k1 * data_range) ** 2
+    c2 = (ssim_k2 * data_range) ** 2
+    mean_first = uniform_filter(first, ssim_window)
+    mean_second = uniform_filter(second, ssim_window)
+    var_first = uniform_filter(first * first, ssim_window) - mean_first ** 2
+    var_second = uniform_filter(second * second, ssim_window) - mean_second ** 2
+    covariance = uniform_filter(first * second, ssim_window) - mean_first * mean_second
+    ssim_map = ((2 * mean_first * mean_second + c1) * (2 * covariance + c2)) / \
+               ((mean_first ** 2 + mean_second ** 2 + c1) * (var_first + var_second + c2))
+    return float(ssim_map.mean())
+
+
+class QualityMetrics:
+    # reference is normalized once, reconstructions are compared on the same (optionally strided) grid
+
+    def __init__(self, original, metrics=("mse",), every=1, time_budget=None, stride=1) -> None:
+        for name in metrics:
+            if name not in available_metrics:
+                raise Exception("Unknown metric " + str(name))
+        self.metrics = tuple(metrics)
+        self.every = max(1, every)
+        self.time_budget = time_budget
+        self.stride = max(1, stride)
+        reference = np.array(original[::self.stride, ::self.stride], dtype=float)
+        reference -= reference.min()
+        self.reference = reference
+        self.reference_max = reference.max()
+        self.last_time = None
+        self.last = {}
+
+    def due(self, iter, last_iter=None):
+        if iter == last_iter or self.last_time is None:
+            return True
+        if self.time_budget is not None:
+            return time.perf_counter() - self.last_time >= self.time_budget
+        return iter % self.every == 0
+
+    def normalized(self, reconstructed):
+        reconstructed_copy = np.array(reconstructed[::self.stride, ::self.stride], dtype=float)
+        reconstructed_copy -= reconstructed_copy.min()
+        rec_copy_max = reconstructed_copy.max()
+        if rec_copy_max > 0 and self.reference_max > 0:
+            reconstructed_copy *= self.reference_max / rec_copy_max
+        return reconstructed_copy
+
+    def evaluate(self, reconstructed):
+        self.last_time = time.perf_counter()
+        reconstructed_copy = self.normalized(reconstructed)
+        dif = self.reference - reconstructed_copy
+        dif **= 2
+        mse = float(dif.sum() / dif.size)
+        result = {"mse": mse}
+        if "psnr" in self.metrics:
+            result["psnr"] = float(10 * np.log10(self.reference_max ** 2 / mse)) \
+                if mse > 0 and self.reference_max > 0 else float("inf")
+        if "ssim" in self.metrics:
+            result["ssim"] = structural_similarity(self.reference, reconstructed_copy, self.reference_max or 1)
+        self.last = result
+        return result
@@ -0,0 +1,89 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+from skimage.transform import rotate
+
+worker_state = {}
+
+
+def share_array(array):
+    memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+    shared[...] = array
+    return memory, shared
+
+
+def describe(memory, array):
+    return memory.name, array.shape, array.dtype.str
+
+
+def attach(description):
+    name, shape, dtype = description
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+
+def init_worker(image, mask, sinogram, indexes, real_dim):
+    worker_state.clear()
+    for key, description in (("image", image), ("mask", mask), ("sinogram", sinogram)):
+        memory, array = attach(description)
+        worker_state[key + "_memory"] = memory
+        worker_state[key] = array
+    worker_state["indexes"] = indexes
+    worker_state["real_dim"] = real_dim
+
+
+def project_range(begin, rotations):
+    image = worker_state["image"]
+    mask = worker_state["mask"]
+    sinogram = worker_state["sinogram"]
+    indexes = worker_state["indexes"]
+    real_dim = worker_state["real_dim"]
+    for i, rotation in enumerate(rotations, begin):
+        rotation += 90
+        common_part = rotate(mask, rotation) * image
+        common_rotated_again = rotate(common_part, -rotation - 90)
+        sinogram[i] = common_rotated_again[indexes].sum(axis=1) / real_dim
+    return begin, begin + len(rotations)
+
+
+def split_angles(theta, workers, chunk_size=None):
+    if chunk_size is None:
+        chunk_size = max(1, int(np.ceil(len(theta) / (workers * 4))))
+    return [(begin, list(theta[begin:begin + chunk_size])) for begin in range(0, len(theta), chunk_size)]
+
+
+def make_radon_parallel(increased_image, tomograph, real_dim, theta, on_change=None, workers=None, out=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    dtype = tomograph.dtype
+    res = np.zeros((len(theta), tomograph.width), dtype=dtype) if out is None else out
+    image_memory, image = share_array(np.ascontiguousarray(increased_image, dtype=dtype))
+    mask_memory, mask = share_array(np.ascontiguousarray(tomograph.tomograph, dtype=dtype))
+    sinogram_memory, sinogram = share_array(np.zeros((len(theta), tomograph.width), dtype=dtype))
+    memories = [image_memory, mask_memory, sinogram_memory]
+    try:
+        init_args = (describe(image_memory, image), describe(mask_memory, mask),
+                     describe(sinogram_memory, sinogram), list(tomograph.indexes), real_dim)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args) as executor:
+            tasks = [executor.submit(project_range, begin, rotations)
+                     for begin, rotations in split_angles(theta, workers)]
+            done = np.zeros(len(theta), dtype=bool)
+            next_iter = 0
+            for task in as_completed(tasks):
+                begin, end = task.result()
+                res[begin:end] = sinogram[begin:end]
+                done[begin:end] = True
+                # report progress in angle order, even though ranges finish out of order
+                while next_iter < len(theta) and done[next_iter]:
+                    if on_change is not None:
+                        on_change(si=res, iter=next_iter)
+                    next_iter += 1
+    finally:
+        del image, mask, sinogram
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+    return res
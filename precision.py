@@ -0,0 +1,84 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+import transformer as tr
+
+default_images = ["Shepp_logan.jpg", "Kwadraty2.jpg", "CT_ScoutView.jpg"]
+default_engines = ["rotate/rotate", "sparse/interpolate", "batched/threaded", "batched/hierarchical",
+                   "batched/fourier", "sparse/sart"]
+
+
+def make_params(engine, alpha, emitters, image_name, dtype):
+    projection, backprojection = engine.split("/")
+    reconstruction = backprojection if backprojection in tr.reconstruction_methods else "fbp"
+    backprojection = "rotate" if reconstruction != "fbp" else backprojection
+    return tr.Parameters(alpha, emitters, True, image_name, projection=projection, backprojection=backprojection,
+                         reconstruction=reconstruction, iterations=5, dtype=dtype)
+
+
+def compare_precisions(image, image_name, engine, alpha, emitters):
+    # the same scan in float64 and float32; differences are measured on the normalized reconstructions
+    results = {}
+    for dtype in ("float64", "float32"):
+        params = make_params(engine, alpha, emitters, image_name, dtype)
+        start = time.perf_counter()
+        square, sinogram, _, i_sin = tr.run_pipeline(params, image)
+        results[dtype] = (square, sinogram, i_sin, time.perf_counter() - start)
+    image, sinogram64, i_sin64, time64 = results["float64"]
+    _, sinogram32, i_sin32, time32 = results["float32"]
+    if i_sin32.dtype != np.float32 or sinogram32.dtype != np.float32:
+        raise Exception("float32 run of %s returned %s/%s" % (engine, sinogram32.dtype, i_sin32.dtype))
+    scale = np.abs(sinogram64).max() or 1
+    return dict(image=image_name, engine=engine, alpha=alpha, emitters=emitters,
+                sinogram_error=float(np.abs(sinogram32 - sinogram64).max() / scale),
+                max_error=float(np.abs(i_sin32 - i_sin64).max()),
+                mean_error=float(np.abs(i_sin32 - i_sin64).mean()),
+                mse64=tr.get_medium_squared_error(image, i_sin64),
+                mse32=tr.get_medium_squared_error(image, i_sin32),
+                time64=time64, time32=time32)
+
+
+def to_markdown(rows):
+    lines = ["| image | engine | sinogram max rel. error | reconstruction max / mean abs. error | "
+             "MSE float64 | MSE float32 | time float64 | time float32 |",
+             "|---|---|---|---|---|---|---|---|"]
+    for r in rows:
+        lines.append("| %s | %s | %.1e | %.1e / %.1e | %.5f | %.5f | %.2fs | %.2fs |" % (
+            r["image"], r["engine"], r["sinogram_error"], r["max_error"], r["mean_error"], r["mse64"], r["mse32"],
+            r["time64"], r["time32"]))
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare float32 against float64 reconstructions")
+    parser.add_argument("--images", nargs="+", default=default_images)
+    parser.add_argument("--engines", nargs="+", default=default_engines,
+                        help="projection/backprojection pairs, backprojection may also be fourier or sart")
+    parser.add_argument("--scale", type=float, default=0.2)
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument("--emitters", type=int, default=100)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = []
+    for image_name, engine in itertools.product(args.images, args.engines):
+        image = tr.read_image(os.path.join(tr.img_name_root, image_name), args.scale)
+        rows.append(compare_precisions(image, image_name, engine, args.alpha, args.emitters))
+        print("%s %s done" % (image_name, engine), file=sys.stderr)
+    print(to_markdown(rows))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
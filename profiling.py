@@ -0,0 +1,124 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+disabled_context = nullcontext()
+
+
+class NullTracer:
+    enabled = False
+
+    def start(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def stage(self, name, **args):
+        return disabled_context
+
+    def angle_stage(self, name, iter):
+        return disabled_context
+
+
+null_tracer = NullTracer()
+
+
+class Tracer:
+    # stage timers always, per angle events only with per_angle, tracemalloc and cProfile on request
+    enabled = True
+
+    def __init__(self, per_angle=False, allocations=False, profile=False, profile_top=30) -> None:
+        self.per_angle = per_angle
+        self.allocations = allocations
+        self.profile = profile
+        self.profile_top = profile_top
+        self.events = []
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.origin = None
+        self.profiler = None
+        self.profile_stats = None
+        self.started_tracemalloc = False
+
+    def now_us(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def start(self):
+        self.origin = time.perf_counter()
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def finish(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(self.profile_top)
+            self.profile_stats = stream.getvalue()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    def add_event(self, name, begin, end, args):
+        event = dict(name=name, ph="X", ts=begin, dur=end - begin, pid=os.getpid(),
+                     tid=threading.get_ident(), args=args)
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def stage(self, name, **args):
+        if self.origin is None:
+            self.start()
+        if self.allocations:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        begin = self.now_us()
+        try:
+            yield
+        finally:
+            end = self.now_us()
+            if self.allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                args = dict(args, allocated_bytes=current - memory_before, peak_bytes=peak - memory_before)
+            self.add_event(name, begin, end, args)
+
+    @contextmanager
+    def angle_stage(self, name, iter):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - begin
+            with self.lock:
+                total = self.totals.setdefault(name, [0.0, 0])
+                total[0] += duration
+                total[1] += 1
+            if self.per_angle and self.origin is not None:
+                end = self.now_us()
+                self.add_event(name, end - duration * 1e6, end, dict(iter=iter))
+
+    def summary(self):
+        stages = {}
+        for event in self.events:
+            if event["name"] not in self.totals:
+                stages[event["name"]] = stages.get(event["name"], 0) + event["dur"] / 1e6
+        angles = {name: dict(seconds=seconds, calls=calls) for name, (seconds, calls) in self.totals.items()}
+        return dict(stages=stages, angles=angles)
+
+    def to_chrome_trace(self):
+        return dict(traceEvents=list(self.events), displayTimeUnit="ms",
+                    otherData=dict(summary=self.summary(), profile=self.profile_stats))
+
+    def write(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_chrome_trace(), file)
@@ -0,0 +1,72 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+
+
+def downsample(data, display_shape):
+    if display_shape is None:
+        return data
+    step_y = max(1, int(np.ceil(data.shape[0] / max(1, display_shape[0]))))
+    step_x = max(1, int(np.ceil(data.shape[1] / max(1, display_shape[1]))))
+    return data[::step_y, ::step_x]
+
+
+class DoubleBuffer:
+    # single writer fills the back buffer without the lock, only the swap and reads are locked
+
+    def __init__(self) -> None:
+        self.front = self.back = None
+        self.fresh = False
+        self.value = None
+        self.lock = Lock()
+
+    def write(self, data, value=None):
+        if self.back is None or self.back.shape != data.shape or self.back.dtype != data.dtype:
+            self.back = np.empty(data.shape, dtype=data.dtype)
+        np.copyto(self.back, data)
+        with self.lock:
+            self.front, self.back = self.back, self.front
+            self.value = value
+            self.fresh = True
+
+    @contextmanager
+    def read(self, only_fresh=True):
+        with self.lock:
+            if only_fresh and not self.fresh:
+                yield None, None
+            else:
+                self.fresh = False
+                yield self.front, self.value
+
+
+class FramePublisher:
+    # coalesces per angle updates to at most one frame per `interval` seconds for every channel
+
+    def __init__(self, interval=0.05, display_shape=None) -> None:
+        self.interval = interval
+        self.display_shape = display_shape
+        self.buffers = {}
+        self.last_publish = {}
+        self.dropped = 0
+
+    def buffer(self, channel):
+        if channel not in self.buffers:
+            self.buffers[channel] = DoubleBuffer()
+        return self.buffers[channel]
+
+    def due(self, channel, now):
+        return now - self.last_publish.get(channel, -np.inf) >= self.interval
+
+    def publish(self, channel, data, value=None, force=False):
+        now = time.perf_counter()
+        if not force and not self.due(channel, now):
+            self.dropped += 1
+            return False
+        self.last_publish[channel] = now
+        self.buffer(channel).write(downsample(data, self.display_shape), value)
+        return True
+
+    def frame(self, channel, only_fresh=True):
+        return self.buffer(channel).read(only_fresh)
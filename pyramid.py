@@ -0,0 +1,82 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from skimage.transform import resize
+
+default_min_size = 32
+default_cached_images = 4
+default_cached_geometries = 16
+
+
+def level_sizes(size, min_size=default_min_size):
+    # coarse to fine, halving every level; the full size itself is not a preview level
+    sizes = []
+    while size // 2 >= min_size:
+        size //= 2
+        sizes.append(size)
+    return sizes[::-1]
+
+
+def image_key(image):
+    image = np.ascontiguousarray(image)
+    return hashlib.sha1(image.tobytes()).hexdigest(), image.shape, image.dtype.str
+
+
+def downsample_level(image, size):
+    return resize(image, (size, size), order=1, mode='reflect', anti_aliasing=True,
+                  preserve_range=True).astype(image.dtype, copy=False)
+
+
+class PyramidCache:
+    # levels are keyed by image content, geometries by whatever key the caller builds them from,
+    # so re-running the same image with other parameters reuses both
+
+    def __init__(self, max_images=default_cached_images, max_geometries=default_cached_geometries) -> None:
+        self.max_images = max_images
+        self.max_geometries = max_geometries
+        self.pyramids = OrderedDict()
+        self.geometries = OrderedDict()
+        self.lock = Lock()
+        self.hits = self.misses = 0
+
+    def levels(self, image, sizes):
+        key = image_key(image)
+        with self.lock:
+            pyramid = self.pyramids.pop(key, {})
+            self.pyramids[key] = pyramid
+            while len(self.pyramids) > self.max_images:
+                self.pyramids.popitem(last=False)
+        # finest first, every level is downsampled from the next finer one
+        source = image
+        for size in sorted(sizes, reverse=True):
+            if size in pyramid:
+                self.hits += 1
+            else:
+                self.misses += 1
+                pyramid[size] = downsample_level(source, size)
+            source = pyramid[size]
+        return [pyramid[size] for size in sizes]
+
+    def geometry(self, key, build):
+        with self.lock:
+            if key in self.geometries:
+                self.hits += 1
+                self.geometries.move_to_end(key)
+                return self.geometries[key]
+            self.misses += 1
+        geometry = build()
+        with self.lock:
+            self.geometries[key] = geometry
+            while len(self.geometries) > self.max_geometries:
+                self.geometries.popitem(last=False)
+        return geometry
+
+    def clear(self):
+        with self.lock:
+            self.pyramids.clear()
+            self.geometries.clear()
+
+
+pyramids = PyramidCache()
@@ -2,7 +2,6 @@ import sys
 import time
 import traceback
 from PyQt5.QtCore import Qt
-from threading import Thread
 
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
@@ -14,8 +13,9 @@ from qtpy import QtWidgets
 
 import transformer as tr
 from DicomModal import DicomDialog
-from dicom_creator import create_dcm_file
+from dicom_creator import create_dataset
 from file_select import SelectFileButton
+from jobs import Cancelled, JobPool
 
 label_margin = 10
 input_margin = 40
@@ -31,10 +31,12 @@ class App(QMainWindow):
         self.width = 1000
         self.height = 800
         self.file_select = self.run_btn = self.emitters_inp = self.alpha_inp = \
-            self.use_filter_cbx = self.interactive_mode = self.dicom_btn = self.slider = None
+            self.use_filter_cbx = self.interactive_mode = self.progressive_cbx = self.dicom_btn = self.slider = None
         self.is_interactive = True
         self.plot = None
         self.scanner = None
+        self.jobs = JobPool(workers=1)
+        self.job = None
         self.is_working = False
         self.image = None
         self.ds = None
@@ -62,6 +64,7 @@ class App(QMainWindow):
         self.add_alpha_input()
         self.add_use_filter_input()
         self.add_interactive_mode_ckbx()
+        self.add_progressive_ckbx()
         self.add_edit_dicom_button()
         self.run_btn.clicked.connect(self.run_task)
         self.add_slider()
@@ -79,26 +82,50 @@ class App(QMainWindow):
     def run_task(self, e):
         try:
             if self.is_working:
+                # the run button turns into cancel while a scan is running
+                if self.job is not None:
+                    self.job.cancel()
                 return
             self.is_working = True
             print("New task started.")
             self.slider.setDisabled(True)
-            self.run_btn.setDisabled(True)
+            self.run_btn.setText("Cancel")
             self.file_select.setDisabled(True)
             self.plot.update_medium_error_value()
             self.is_interactive = self.interactive_mode.isChecked()
             tr.params.set_values(self.alpha_inp.value(), self.emitters_inp.value(),
-                                 self.use_filter_cbx.isChecked(), self.file_select.file_name)
+                                 self.use_filter_cbx.isChecked(), self.file_select.file_name,
+                                 scale=tr.params.scale, progressive=self.progressive_cbx.isChecked(),
+                                 cache_dir=tr.params.cache_dir, cache_size=tr.params.cache_size)
             self.scanner = tr.Scanner(tr.params, self.plot, on_finish=self.on_finish, image=self.image)
             self.plot.init_new_scan(self.scanner)
-            Thread(target=lambda: self.scanner.watch_changes()).start()
+            self.job = self.jobs.submit(self.scanner)
+            self.job.add_done_callback(self.on_job_done)
         except Exception:
             traceback.print_exc()
             self.on_finish(True)
 
+    def on_job_done(self, job):
+        # successful scans already called on_finish, failed or cancelled ones never reach it
+        if job.future.cancelled():
+            self.on_finish(True)
+            return
+        error = job.exception()
+        if isinstance(error, Cancelled):
+            print("Task cancelled.")
+        elif error is not None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        if error is not None:
+            self.on_finish(True)
+
+    def closeEvent(self, event):
+        self.jobs.shutdown(wait=False)
+        super().closeEvent(event)
+
     def on_finish(self, wasException=False):
         print("finished work!")
         self.is_working = False
+        self.run_btn.setText("Run")
         self.run_btn.setDisabled(False)
         self.file_select.setDisabled(False)
         if not self.is_interactive or wasException:
@@ -139,6 +166,12 @@ class App(QMainWindow):
         self.interactive_mode.setChecked(self.is_interactive)
         self.interactive_mode.move(x, input_margin)
 
+    def add_progressive_ckbx(self):
+        x = App.get_x_position(7)
+        self.progressive_cbx = QCheckBox('Progressive\npreview', self)
+        self.progressive_cbx.setChecked(tr.params.progressive)
+        self.progressive_cbx.move(x, input_margin)
+
     def add_use_filter_input(self):
         x = App.get_x_position(2)
         self.use_filter_cbx = QCheckBox('Use sinogram\nfilter', self)
@@ -189,11 +222,11 @@ class App(QMainWindow):
             if file_name.lower().endswith((".dc3", ".dcm", ".dic")):
                 self.ds = pydicom.dcmread(file_name, force=True)
                 self.ds.file_meta.TransferSyntaxUID = pydicom.uid.ImplicitVRLittleEndian
-                self.image = tr.normalize_img(self.ds.pixel_array)
+                self.image = tr.normalize_img(self.ds.pixel_array, tr.params.scale)
                 self.dicom_btn.setDisabled(False)
             else:
-                self.image = tr.read_image(file_name)
-                self.ds = create_dcm_file(np.array(self.image))
+                self.image = tr.read_image(file_name, tr.params.scale)
+                self.ds = create_dataset(self.image)
                 self.dicom_btn.setDisabled(False)
                 # self.dicom_btn.setDisabled(True)
             self.plot.set_image(self.image)
@@ -246,6 +279,10 @@ class PlotCanvas(FigureCanvas):
         self.ax_err.set_yticks(np.arange(0, 1.1, 0.2))
         # self.ax_err.setti
 
+    def get_display_shape(self):
+        box = self.ax3.get_window_extent()
+        return int(box.height), int(box.width)
+
     def set_iterations(self, iterations):
         self.ax_err.set_xlim([0, iterations])
         self.ax_err.set_xticks(np.arange(0, iterations+1, iterations//5))
@@ -286,16 +323,16 @@ class PlotCanvas(FigureCanvas):
         self.im3 = self.ax3.imshow(i_sin, cmap=plt.cm.Greys_r, animated=True)
 
     def update_sin(self, _):
-        if self.scanner.refresh_sinogram:
-            self.scanner.refresh_sinogram = False
-            self.update_chart(self.im2, self.scanner.sinogram)
+        with self.scanner.publisher.frame("sinogram") as (sinogram, _):
+            if sinogram is not None:
+                self.update_chart(self.im2, sinogram)
         return self.im2,
 
     def update_isin(self, _):
-        if self.scanner.refresh_isin:
-            self.scanner.refresh_isin = False
-            self.update_chart(self.im3, self.scanner.i_sin)
-            self.count_medium_error(self.scanner.square_error)
+        with self.scanner.publisher.frame("i_sin") as (i_sin, square_error):
+            if i_sin is not None:
+                self.update_chart(self.im3, i_sin)
+                self.count_medium_error(square_error or 0)
         return self.im3,
 
     def update_error(self, _):
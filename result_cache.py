@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# bump whenever an engine changes its numeric output, older entries then simply stop matching
+engine_version = 1
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "radon-transform")
+default_cache_size = 2 ** 30
+default_checkpoint_budget = 64 * 2 ** 20
+# parameters that change neither the sinogram nor the reconstruction
+ignored_parameters = ("image_name", "workers", "checkpoints", "snapshot_budget", "metrics_time_budget", "work_dir",
+                      "scale", "progressive", "cache_dir", "cache_size")
+
+
+def result_key(image, params):
+    image = np.ascontiguousarray(image)
+    settings = {name: value for name, value in vars(params).items() if name not in ignored_parameters}
+    digest = hashlib.sha256()
+    digest.update(json.dumps([engine_version, image.shape, image.dtype.str, sorted(settings.items())],
+                             default=str).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # one compressed .npz per result; file mtimes double as the LRU order so several processes can share a directory
+
+    def __init__(self, path=default_cache_dir, max_bytes=default_cache_size) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def load(self, key):
+        try:
+            with np.load(self.file(key), allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(self.file(key))
+        except Exception:
+            # missing, evicted meanwhile or truncated entries are all plain misses
+            return None, None
+        metadata = json.loads(str(arrays.pop("metadata")))
+        if metadata.get("engine_version") != engine_version:
+            return None, None
+        return arrays, metadata
+
+    def store(self, key, arrays, metadata):
+        arrays = {name: np.asarray(array) for name, array in arrays.items() if array is not None}
+        arrays["metadata"] = np.array(json.dumps(dict(metadata, engine_version=engine_version), default=str))
+        # written under a temporary name first so readers never see half an entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temporary, self.file(key))
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self.entries():
+            os.remove(os.path.join(self.path, name))
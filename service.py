@@ -0,0 +1,431 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from multiprocessing import Manager
+from urllib.parse import parse_qs, urlparse
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pydicom
+
+import dicom_creator
+import transformer as tr
+from jobs import Cancelled, NullPlot
+
+default_host = "127.0.0.1"
+default_port = 8765
+default_workers = os.cpu_count() or 1
+default_max_pending = 64
+default_kept_results = 64
+default_max_upload = 256 * 2 ** 20
+progress_interval = 0.1
+throughput_window = 60.0
+finished_states = ("done", "failed", "cancelled")
+
+
+def flag(value):
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+# query string arguments, named and validated like Parameters.set_values
+query_parameters = {
+    "alpha": float,
+    "emitters_num": int,
+    "use_filter": flag,
+    "use_omega": flag,
+    "filter_name": str,
+    "projection": str,
+    "backprojection": str,
+    "reconstruction": str,
+    "iterations": int,
+    "subsets": int,
+    "relaxation": float,
+    "hierarchy_tolerance": float,
+    "streaming": flag,
+    "dtype": str,
+    "scale": float,
+    "beam": str,
+    "fan_spread": float,
+}
+
+
+def parse_parameters(query):
+    values = {}
+    for name, values_list in parse_qs(query).items():
+        if name not in query_parameters:
+            raise Exception("Unknown parameter " + name)
+        values[name] = query_parameters[name](values_list[-1])
+    return values
+
+
+def make_params(values, image_name, cache_dir=None):
+    values = dict(values, cache_dir=cache_dir)
+    alpha = values.pop("alpha", tr.params.alpha)
+    emitters_num = values.pop("emitters_num", tr.params.emitters_num)
+    use_filter = values.pop("use_filter", True)
+    params = tr.Parameters(alpha, emitters_num, use_filter, image_name)
+    params.set_values(alpha, emitters_num, use_filter, image_name, **values)
+    return params
+
+
+def is_dicom(data):
+    return data[128:132] == b"DICM"
+
+
+def upload_suffix(data):
+    # image readers pick their decoder from the extension
+    if is_dicom(data):
+        return ".dcm"
+    for magic, suffix in ((b"\x89PNG", ".png"), (b"\xff\xd8", ".jpg"), (b"BM", ".bmp")):
+        if data.startswith(magic):
+            return suffix
+    raise Exception("Upload is neither DICOM nor a PNG, JPEG or BMP image")
+
+
+def load_upload(path, params):
+    with open(path, "rb") as file:
+        header = file.read(132)
+    if is_dicom(header):
+        # stored values may use the whole 16 bit range, normalize_img only knows about 8 bit images
+        pixels = pydicom.dcmread(path, force=True).pixel_array.astype(float)
+        return tr.normalize_img(pixels / (pixels.max() or 1), params.scale)
+    # plain images are read by prepare_instance from params.image_name
+    return None
+
+
+class RemoteJob:
+    # stands in for jobs.Job inside the pool processes, progress and cancellation go through the manager
+
+    def __init__(self, job_id, state, scanner) -> None:
+        self.job_id = job_id
+        self.state = state
+        self.scanner = scanner
+        self.reported = 0
+
+    def check(self):
+        now = time.monotonic()
+        if now - self.reported < progress_interval:
+            return
+        self.reported = now
+        self.state[(self.job_id, "progress")] = self.scanner.progress()
+        if self.state.get((self.job_id, "cancel")):
+            raise Cancelled("Job was cancelled")
+
+
+def run_job(job_id, path, values, state, cache_dir=None):
+    # runs in a pool process; module level caches (tomographs, system matrices, ray tables, filters)
+    # live as long as the process, so repeated geometries skip their setup
+    state[(job_id, "started")] = time.time()
+    if state.get((job_id, "cancel")):
+        raise Cancelled("Job was cancelled")
+    params = make_params(values, path, cache_dir)
+    scanner = tr.Scanner(params, NullPlot(), load_upload(path, params))
+    scanner.job = RemoteJob(job_id, state, scanner)
+    scanner.watch_changes()
+    state[(job_id, "progress")] = 1.0
+    return dict(sinogram=np.asarray(scanner.sinogram), reconstruction=np.asarray(scanner.current_reconstruction()),
+                square_error=float(scanner.square_error), angles=len(scanner.theta), cached=scanner.cached,
+                worker=os.getpid())
+
+
+class ServiceJob:
+
+    def __init__(self, job_id, values, path) -> None:
+        self.job_id = job_id
+        self.values = values
+        self.path = path
+        self.submitted = time.time()
+        self.finished = None
+        self.future = None
+        self.status = "queued"
+        self.error = None
+        self.result = None
+
+
+class ReconstructionService:
+
+    def __init__(self, workers=default_workers, max_pending=default_max_pending, kept_results=default_kept_results,
+                 cache_dir=None) -> None:
+        self.max_pending = max_pending
+        self.kept_results = kept_results
+        self.cache_dir = cache_dir
+        self.spool = tempfile.mkdtemp(prefix="radon-service-")
+        self.manager = Manager()
+        self.state = self.manager.dict()
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = dict(submitted=0, done=0, failed=0, cancelled=0, rejected=0)
+        self.latencies = deque(maxlen=1000)
+        self.waits = deque(maxlen=1000)
+        self.completions = deque()
+
+    def submit(self, data, query):
+        values = parse_parameters(query)
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.spool, job_id + upload_suffix(data))
+        # validated here, so bad parameters are rejected before anything is queued
+        make_params(values, path, self.cache_dir)
+        with self.lock:
+            if self.queue_depth() + self.running() >= self.max_pending:
+                self.counts["rejected"] += 1
+                raise Exception("Job queue is full")
+            with open(path, "wb") as file:
+                file.write(data)
+            job = ServiceJob(job_id, values, path)
+            job.future = self.executor.submit(run_job, job_id, path, values, self.state, self.cache_dir)
+            self.jobs[job_id] = job
+            self.counts["submitted"] += 1
+        job.future.add_done_callback(lambda _: self.on_done(job))
+        return job
+
+    def on_done(self, job):
+        job.finished = time.time()
+        if job.future.cancelled():
+            job.status = "cancelled"
+        elif isinstance(job.future.exception(), Cancelled):
+            job.status = "cancelled"
+        elif job.future.exception() is not None:
+            job.status = "failed"
+            job.error = "%s: %s" % (type(job.future.exception()).__name__, job.future.exception())
+        else:
+            job.result = job.future.result()
+            job.status = "done"
+        started = self.state.get((job.job_id, "started"))
+        with self.lock:
+            self.counts[job.status] += 1
+            if job.status == "done":
+                self.latencies.append(job.finished - job.submitted)
+                self.waits.append(started - job.submitted)
+                self.completions.append(job.finished)
+            self.forget_old_results()
+        if os.path.exists(job.path):
+            os.remove(job.path)
+
+    def forget_old_results(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - self.kept_results)]:
+            del self.jobs[job_id]
+            for key in ("started", "progress", "cancel"):
+                self.state.pop((job_id, key), None)
+
+    def get(self, job_id):
+        with self.lock:
+            if job_id not in self.jobs:
+                raise KeyError(job_id)
+            return self.jobs[job_id]
+
+    def describe(self, job):
+        status = job.status
+        started = self.state.get((job.job_id, "started"))
+        if status == "queued" and started is not None:
+            status = "running"
+        progress = 1.0 if status == "done" else self.state.get((job.job_id, "progress"), 0.0)
+        description = dict(id=job.job_id, status=status, progress=progress, submitted=job.submitted,
+                           started=started, finished=job.finished, parameters=job.values, error=job.error)
+        if job.result is not None:
+            description.update(square_error=job.result["square_error"], angles=job.result["angles"],
+                               cached=job.result["cached"], worker=job.result["worker"])
+        return description
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        self.state[(job_id, "cancel")] = True
+        job.future.cancel()
+        return job
+
+    def result(self, job_id, what="reconstruction", format="npy"):
+        job = self.get(job_id)
+        if job.status != "done":
+            raise Exception("Job %s is %s" % (job_id, job.status))
+        if what not in ("reconstruction", "sinogram"):
+            raise Exception("Unknown result " + what)
+        data = job.result[what]
+        if format == "npy":
+            buffer = BytesIO()
+            np.save(buffer, data)
+            return "application/octet-stream", buffer.getvalue()
+        if format == "dicom":
+            image = tr.norm(np.array(data, dtype=float))
+            description = "Radon %s alpha=%s emitters=%s" % (what, job.values.get("alpha", tr.params.alpha),
+                                                             job.values.get("emitters_num", tr.params.emitters_num))
+            return "application/dicom", dicom_creator.encode(dicom_creator.create_dataset(image,
+                                                                                          description=description))
+        raise Exception("Unknown format " + format)
+
+    def queue_depth(self):
+        return sum(1 for job in self.jobs.values()
+                   if job.finished is None and self.state.get((job.job_id, "started")) is None)
+
+    def running(self):
+        return sum(1 for job in self.jobs.values()
+                   if job.finished is None and self.state.get((job.job_id, "started")) is not None)
+
+    def metrics(self):
+        now = time.time()
+        with self.lock:
+            while self.completions and self.completions[0] < now - throughput_window:
+                self.completions.popleft()
+            latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+            waits = np.array(self.waits) if self.waits else np.zeros(1)
+            return dict(uptime=now - self.started, workers=self.workers, queue_depth=self.queue_depth(),
+                        running=self.running(), jobs=dict(self.counts),
+                        latency=dict(mean=float(latencies.mean()), p50=float(np.percentile(latencies, 50)),
+                                     p95=float(np.percentile(latencies, 95)), max=float(latencies.max())),
+                        queue_wait=dict(mean=float(waits.mean()), p95=float(np.percentile(waits, 95))),
+                        throughput=len(self.completions) / min(throughput_window, max(now - self.started, 1e-9)))
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if job.finished is None:
+                self.cancel(job.job_id)
+        self.executor.shutdown(wait=True)
+        self.manager.shutdown()
+        shutil.rmtree(self.spool, ignore_errors=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # POST /jobs?alpha=..         upload an image or DICOM file as the request body
+    # GET /jobs/<id>              status and progress
+    # GET /jobs/<id>/events       newline delimited JSON progress until the job finishes
+    # GET /jobs/<id>/result       ?what=reconstruction|sinogram&format=npy|dicom
+    # DELETE /jobs/<id>           cancel
+    # GET /metrics                queue depth, latency and throughput
+    service = None
+    max_upload = default_max_upload
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code, data):
+        self.send_body(code, "application/json", json.dumps(data, default=str).encode())
+
+    def route(self):
+        url = urlparse(self.path)
+        return [part for part in url.path.split("/") if part], url.query
+
+    def handle_errors(self, handler):
+        try:
+            handler()
+        except KeyError as e:
+            self.send_json(404, dict(error="Unknown job %s" % e))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.send_json(400, dict(error=str(e)))
+
+    def do_POST(self):
+        self.handle_errors(self.post)
+
+    def do_GET(self):
+        self.handle_errors(self.get)
+
+    def do_DELETE(self):
+        self.handle_errors(self.delete)
+
+    def post(self):
+        parts, query = self.route()
+        if parts != ["jobs"]:
+            return self.send_json(404, dict(error="Not found"))
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0 or length > self.max_upload:
+            return self.send_json(413 if length > 0 else 400, dict(error="Upload size %d not accepted" % length))
+        job = self.service.submit(self.rfile.read(length), query)
+        self.send_json(202, self.service.describe(job))
+
+    def get(self):
+        parts, query = self.route()
+        if parts == ["metrics"]:
+            return self.send_json(200, self.service.metrics())
+        if len(parts) == 2 and parts[0] == "jobs":
+            return self.send_json(200, self.service.describe(self.service.get(parts[1])))
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            return self.stream_events(self.service.get(parts[1]))
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            options = {name: values[-1] for name, values in parse_qs(query).items()}
+            content_type, body = self.service.result(parts[1], options.get("what", "reconstruction"),
+                                                     options.get("format", "npy"))
+            return self.send_body(200, content_type, body)
+        self.send_json(404, dict(error="Not found"))
+
+    def delete(self):
+        parts, _ = self.route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self.send_json(404, dict(error="Not found"))
+        self.send_json(202, self.service.describe(self.service.cancel(parts[1])))
+
+    def stream_events(self, job):
+        # no Content-Length, the connection is closed after the last event
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        self.close_connection = True
+        while True:
+            description = self.service.describe(job)
+            self.wfile.write((json.dumps(dict(status=description["status"], progress=description["progress"],
+                                              error=description["error"])) + "\n").encode())
+            self.wfile.flush()
+            if description["status"] in finished_states:
+                return
+            time.sleep(progress_interval)
+
+
+def make_server(service, host=default_host, port=default_port):
+    handler = type("BoundRequestHandler", (RequestHandler,), dict(service=service))
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP reconstruction service")
+    parser.add_argument("--host", default=default_host)
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--workers", type=int, default=default_workers, help="reconstruction processes")
+    parser.add_argument("--max-pending", type=int, default=default_max_pending,
+                        help="queued and running jobs before new ones are rejected")
+    parser.add_argument("--keep-results", type=int, default=default_kept_results,
+                        help="finished jobs kept in memory for download")
+    parser.add_argument("--cache-dir", help="also keep results in this on-disk result cache")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = ReconstructionService(args.workers, args.max_pending, args.keep_results, args.cache_dir)
+    server = make_server(service, args.host, args.port)
+    print("Serving on http://%s:%d" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import numpy as np
+from scipy import sparse
+
+from system_matrix import SystemMatrixCache
+
+beams = ("parallel", "fan")
+# arc of the emitter/detector circle covered by the fan detectors, in degrees;
+# 180 keeps the whole real image inside the fan
+default_spread = 180.0
+
+
+class RayGeometry:
+    # emitter/detector layout around the padded image; coordinates are in pixels from the image centre,
+    # x along columns and y along rows, like crop_grid
+
+    def __init__(self, tomograph, beam="parallel", spread=default_spread) -> None:
+        if beam not in beams:
+            raise Exception("Unknown beam " + str(beam))
+        self.dim = tomograph.dim
+        self.width = tomograph.width
+        self.dtype = tomograph.dtype
+        self.beam = beam
+        self.spread = float(spread)
+        center = tomograph.dim / 2.0 - 0.5
+        # parallel detectors sit where the tomograph stripes are
+        self.positions = np.asarray(tomograph.indexes, dtype=float) - center
+        # fan emitter and detectors lie on the circle around the padded square
+        self.radius = tomograph.dim / np.sqrt(2)
+        if self.width > 1:
+            self.offsets = np.deg2rad(self.spread) * (0.5 - np.arange(self.width) / (self.width - 1))
+        else:
+            self.offsets = np.zeros(1)
+
+    def key(self):
+        return self.beam, self.dim, self.width, self.spread if self.beam == "fan" else None, self.dtype.str
+
+    def rays(self, rotation):
+        # same direction convention as add_backprojection: detector s = cos*x - sin*y, rays run along sin*x + cos*y
+        rad = np.deg2rad(rotation + 90)
+        cos, sin = np.cos(rad), np.sin(rad)
+        if self.beam == "parallel":
+            across = np.stack([cos * self.positions, -sin * self.positions], axis=1)
+            along = np.array([sin, cos]) * self.radius
+            return across - along, across + along
+        central = np.pi / 2 - rad
+        emitter = -self.radius * np.array([np.cos(central), np.sin(central)])
+        detectors = self.radius * np.stack([np.cos(central + self.offsets), np.sin(central + self.offsets)], axis=1)
+        return np.broadcast_to(emitter, detectors.shape), detectors
+
+    def fan_angles(self):
+        # angle between every ray and the central one, seen from the emitter
+        return self.offsets / 2
+
+
+def trace_rays(starts, ends, dim):
+    # Siddon traversal: crossings with the column and row planes are merged along every ray, so
+    # each segment between two neighbouring crossings lies in exactly one pixel
+    half = dim / 2.0
+    planes = np.arange(dim + 1) - half
+    delta = ends - starts
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    low = np.zeros(len(starts))
+    high = np.ones(len(starts))
+    crossings = []
+    for axis in (0, 1):
+        step = delta[:, axis:axis + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alphas = (planes - starts[:, axis:axis + 1]) / step
+        # rays parallel to the planes never cross them, they are inside the grid or miss it entirely
+        parallel = delta[:, axis] == 0
+        inside = np.abs(starts[:, axis]) < half
+        low = np.maximum(low, np.where(parallel, np.where(inside, -np.inf, np.inf),
+                                       np.minimum(alphas[:, 0], alphas[:, -1])))
+        high = np.minimum(high, np.where(parallel, np.where(inside, np.inf, -np.inf),
+                                         np.maximum(alphas[:, 0], alphas[:, -1])))
+        # ascending along every ray, so the merge below only joins two sorted runs
+        crossings.append(np.where(step < 0, alphas[:, ::-1], alphas))
+    high = np.maximum(high, low)
+    alphas = np.concatenate([low[:, None]] + crossings + [high[:, None]], axis=1)
+    alphas = np.where(np.isfinite(alphas), alphas, low[:, None])
+    alphas = np.sort(np.clip(alphas, low[:, None], high[:, None]), axis=1, kind='stable')
+    segments = np.diff(alphas, axis=1)
+    middle = (alphas[:, 1:] + alphas[:, :-1]) / 2
+    columns = np.floor(starts[:, 0:1] + middle * delta[:, 0:1] + half).astype(np.int64)
+    rows = np.floor(starts[:, 1:2] + middle * delta[:, 1:2] + half).astype(np.int64)
+    valid = (segments > 1e-12) & (columns >= 0) & (columns < dim) & (rows >= 0) & (rows < dim)
+    rays = np.nonzero(valid)[0]
+    return rays, rows[valid] * dim + columns[valid], segments[valid] * length[rays]
+
+
+def angle_rays(geometry, rotation, real_dim):
+    # (width, dim^2) intersection lengths, scaled like Tomograph.get_intersection
+    rays, pixels, lengths = trace_rays(*geometry.rays(rotation), geometry.dim)
+    return sparse.csr_matrix(((lengths / real_dim).astype(geometry.dtype), (rays, pixels)),
+                             shape=(geometry.width, geometry.dim * geometry.dim))
+
+
+def build_ray_table(geometry, theta, real_dim):
+    return sparse.vstack([angle_rays(geometry, rotation, real_dim) for rotation in theta], format='csr')
+
+
+def ray_table_key(geometry, theta, real_dim):
+    return geometry.key(), tuple(float(t) for t in theta), int(real_dim)
+
+
+# forward projection, backprojection and SART all read the same tables
+ray_tables = SystemMatrixCache(key=ray_table_key, build=build_ray_table)
+
+
+def make_radon_siddon(increased_image, tomograph, real_dim, theta, on_change=None, beam="parallel",
+                      spread=default_spread, cache=None, out=None):
+    if cache is None:
+        cache = ray_tables
+    table = cache.get(RayGeometry(tomograph, beam, spread), theta, real_dim)
+    pixels = np.ravel(increased_image)
+    width = tomograph.width
+    res = np.zeros((len(theta), width), dtype=tomograph.dtype) if out is None else out
+    if on_change is None:
+        res[...] = (table @ pixels).reshape(len(theta), width)
+        return res
+    for i in range(len(theta)):
+        res[i] = table[i * width:(i + 1) * width] @ pixels
+        on_change(si=res, iter=i)
+    return res
+
+
+def weight_fan_sinogram(sinogram, tomograph, spread=default_spread):
+    # cosine pre-weighting of fan-beam FBP, applied before the ramp filter
+    weights = np.cos(RayGeometry(tomograph, "fan", spread).fan_angles()).astype(tomograph.dtype)
+    return sinogram * weights
+
+
+def inverse_radon_siddon(sigmoid, rotations, output_size, tomograph, on_change=None, beam="parallel",
+                         spread=default_spread, cache=None, out=None):
+    # ray-driven backprojection, the transpose of the forward ray table
+    if cache is None:
+        cache = ray_tables
+    table = cache.get(RayGeometry(tomograph, beam, spread), rotations, output_size)
+    dim = tomograph.dim
+    width = tomograph.width
+    start = (dim - output_size) // 2
+    crop = slice(start, start + output_size)
+    rows = np.asarray(sigmoid, dtype=tomograph.dtype)
+    result = np.zeros((output_size, output_size), dtype=tomograph.dtype) if out is None else out
+    if on_change is None:
+        result[...] = (table.T @ rows.ravel()).reshape(dim, dim)[crop, crop]
+    else:
+        result[...] = 0
+        for i in range(len(rotations)):
+            result += (table[i * width:(i + 1) * width].T @ rows[i]).reshape(dim, dim)[crop, crop]
+            on_change(isi=result, iter=i)
+    mat_min = result.min()
+    result -= mat_min
+    mat_max = result.max()
+    if mat_max > 0:
+        result /= mat_max
+    return result
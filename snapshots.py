@@ -0,0 +1,145 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+default_memory_budget = 256 * 2 ** 20
+default_cached_frames = 8
+
+
+class TransformSnapshot:
+
+    def __init__(self, sinogram=None, i_sin=None, square_error=None) -> None:
+        self.sinogram = sinogram
+        self.i_isn = i_sin
+        self.square_error = square_error
+
+
+class SnapshotStore:
+    # sinogram rows are final once written so the sinogram is kept once; reconstructions are kept
+    # as checkpoints every `stride` angles and intermediate ones are replayed on demand
+
+    def __init__(self, angles_num, replay=None, memory_budget=default_memory_budget,
+                 cached_frames=default_cached_frames, work=None) -> None:
+        self.angles_num = angles_num
+        self.work = work
+        self.replay = replay
+        self.memory_budget = memory_budget
+        self.cached_frames = cached_frames
+        self.sinogram = None
+        self.sinogram_iter = -1
+        self.errors = np.full(angles_num, np.nan)
+        self.checkpoint_iters = []
+        self.checkpoints = []
+        self.stride = None
+        self.last_iter = -1
+        self.frames = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return self.angles_num
+
+    def get_stride(self, frame):
+        if self.stride is None:
+            max_checkpoints = max(1, self.memory_budget // max(1, frame.nbytes))
+            self.stride = max(1, int(np.ceil(self.angles_num / max_checkpoints)))
+        return self.stride
+
+    def is_checkpoint(self, frame, iter):
+        if not self.checkpoint_iters or iter == self.angles_num - 1:
+            return True
+        if self.replay is None:
+            # nothing to replay from, keep every frame that still fits in the budget
+            return (len(self.checkpoints) + 1) * frame.nbytes <= self.memory_budget
+        stride = self.get_stride(frame)
+        return iter // stride > self.checkpoint_iters[-1] // stride
+
+    def add_sinogram(self, si, iter):
+        with self.lock:
+            if self.sinogram is None and self.work is not None:
+                self.sinogram = self.work.create("snapshot_sinogram", si.shape, si.dtype)
+            elif self.sinogram is None:
+                self.sinogram = np.zeros_like(si)
+            self.sinogram[self.sinogram_iter + 1:iter + 1] = si[self.sinogram_iter + 1:iter + 1]
+            self.sinogram_iter = iter
+            self.frames.clear()
+
+    def add_reconstruction(self, isi, iter, square_error):
+        with self.lock:
+            if square_error is not None:
+                self.errors[self.last_iter + 1:iter + 1] = square_error
+            if self.is_checkpoint(isi, iter):
+                self.checkpoint_iters.append(iter)
+                if self.work is not None:
+                    self.checkpoints.append(self.work.store("checkpoint-%05d" % iter, isi))
+                else:
+                    self.checkpoints.append(np.array(isi))
+            self.last_iter = iter
+            self.frames.clear()
+
+    def square_error(self, i):
+        error = self.errors[i]
+        return None if np.isnan(error) else float(error)
+
+    def errors_to(self, i):
+        return [float(e) for e in self.errors[:i] if not np.isnan(e)]
+
+    def sinogram_at(self, i):
+        if self.sinogram is None:
+            return None
+        frame = np.array(self.sinogram)
+        frame[i + 1:] = 0
+        return frame
+
+    def reconstruction_at(self, i):
+        position = bisect_right(self.checkpoint_iters, i) - 1
+        if self.replay is None:
+            position = max(position, 0)
+            return self.checkpoints[position] if self.checkpoints else None
+        if position >= 0 and self.checkpoint_iters[position] == i:
+            return self.checkpoints[position]
+        if position >= 0:
+            begin = self.checkpoint_iters[position] + 1
+            frame = np.array(self.checkpoints[position])
+        elif self.checkpoints:
+            begin = 0
+            frame = np.zeros_like(self.checkpoints[0])
+        else:
+            return None
+        self.replay(frame, begin, min(i, self.last_iter) + 1)
+        return frame
+
+    def get(self, i):
+        with self.lock:
+            if i in self.frames:
+                self.frames.move_to_end(i)
+                return self.frames[i]
+            snapshot = TransformSnapshot(self.sinogram_at(i), self.reconstruction_at(i), self.square_error(i))
+            self.frames[i] = snapshot
+            while len(self.frames) > self.cached_frames:
+                self.frames.popitem(last=False)
+            return snapshot
+
+    def export(self, max_bytes):
+        # sinogram, errors and evenly spread checkpoints within max_bytes, the last one is always kept
+        with self.lock:
+            if not self.checkpoints:
+                return dict(errors=self.errors, sinogram=self.sinogram)
+            count = max(1, min(len(self.checkpoints), max_bytes // max(1, self.checkpoints[0].nbytes)))
+            chosen = np.unique(np.linspace(len(self.checkpoints) - 1, 0, count).round().astype(int))
+            return dict(errors=self.errors, sinogram=self.sinogram,
+                        checkpoint_iters=np.asarray(self.checkpoint_iters)[chosen],
+                        checkpoints=np.stack([self.checkpoints[i] for i in chosen]))
+
+    def restore(self, data):
+        with self.lock:
+            self.errors = np.array(data["errors"])
+            self.sinogram = data.get("sinogram")
+            if self.sinogram is not None:
+                self.sinogram_iter = len(self.sinogram) - 1
+            if "checkpoints" in data:
+                self.checkpoint_iters = [int(i) for i in data["checkpoint_iters"]]
+                self.checkpoints = list(data["checkpoints"])
+                self.last_iter = self.checkpoint_iters[-1]
+            self.frames.clear()
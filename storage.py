@@ -0,0 +1,42 @@
+import json
+import os
+
+import numpy as np
+
+
+class WorkDirectory:
+    # .npy backed memory maps, results can be reopened later with np.load(..., mmap_mode='r')
+
+    def __init__(self, path) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, name):
+        return os.path.join(self.path, name + ".npy")
+
+    def create(self, name, shape, dtype=float):
+        return np.lib.format.open_memmap(self.file(name), mode="w+", dtype=dtype, shape=tuple(shape))
+
+    def store(self, name, array):
+        stored = self.create(name, np.shape(array), np.asarray(array).dtype)
+        stored[...] = array
+        stored.flush()
+        return stored
+
+    def open(self, name, mode="r"):
+        return np.load(self.file(name), mmap_mode=mode)
+
+    def exists(self, name):
+        return os.path.exists(self.file(name))
+
+    def remove(self, name):
+        if self.exists(name):
+            os.remove(self.file(name))
+
+    def save_metadata(self, metadata):
+        with open(os.path.join(self.path, "metadata.json"), "w") as file:
+            json.dump(metadata, file, indent=1, default=str)
+
+    def load_metadata(self):
+        with open(os.path.join(self.path, "metadata.json")) as file:
+            return json.load(file)
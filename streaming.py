@@ -0,0 +1,114 @@
+from queue import Queue
+from threading import Lock, Thread
+
+import numpy as np
+
+from backprojection import add_backprojection, crop_grid
+from filter_bank import filter_sinograms
+
+default_queue_size = 16
+end_of_stream = object()
+
+
+class StreamingReconstructor:
+    # filtering is per projection and backprojection is additive, so rows can be consumed one by one
+
+    def __init__(self, tomograph, output_size, use_filter=True, filter_name="ram-lak", use_omega=False) -> None:
+        self.tomograph = tomograph
+        self.use_filter = use_filter
+        self.filter_name = filter_name
+        self.use_omega = use_omega
+        self.grid = crop_grid(tomograph.dim, output_size, tomograph.dtype)
+        self.accumulator = np.zeros((output_size, output_size), dtype=tomograph.dtype)
+        self.rows = 0
+        self.lock = Lock()
+
+    def add_row(self, rotation, row):
+        if self.use_filter:
+            row = filter_sinograms(row, self.filter_name, self.use_omega)
+        with self.lock:
+            add_backprojection(self.accumulator, row, rotation, self.tomograph, self.grid)
+            self.rows += 1
+        return row
+
+    def current(self, normalized=False):
+        with self.lock:
+            result = np.array(self.accumulator)
+        if normalized:
+            result -= result.min()
+            result_max = result.max()
+            if result_max > 0:
+                result /= result_max
+        return result
+
+
+def rows_source(rows):
+    # external acquisition: any iterable of (index, rotation, row)
+    def produce(emit):
+        for index, rotation, row in rows:
+            emit(index, rotation, row)
+    return produce
+
+
+def projection_source(engine, increased_image, tomograph, real_dim, theta, on_change=None):
+    # runs a make_radon style engine and emits every row once it is final
+    def produce(emit):
+        state = dict(emitted=-1)
+
+        def on_rows(si, iter):
+            if on_change is not None:
+                on_change(si=si, iter=iter)
+            for i in range(state["emitted"] + 1, iter + 1):
+                emit(i, theta[i], np.array(si[i]))
+            state["emitted"] = iter
+
+        return engine(increased_image, tomograph, real_dim, theta, on_change=on_rows)
+    return produce
+
+
+class StreamingPipeline:
+    # producer and reconstruction run concurrently, connected by a bounded queue
+
+    def __init__(self, reconstructor, queue_size=default_queue_size) -> None:
+        self.reconstructor = reconstructor
+        self.rows = Queue(maxsize=queue_size)
+        self.filtered = {}
+        self.produced = None
+        self.error = None
+
+    def run(self, produce, on_row=None):
+        producer = Thread(target=self.produce, args=(produce,), daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = self.rows.get()
+                if item is end_of_stream:
+                    break
+                index, rotation, row = item
+                self.filtered[index] = self.reconstructor.add_row(rotation, row)
+                if on_row is not None:
+                    on_row(index)
+        except BaseException:
+            # a producer blocked on the full queue would never finish, drain it before giving up
+            while self.rows.get() is not end_of_stream:
+                pass
+            raise
+        finally:
+            producer.join()
+        if self.error is not None:
+            raise self.error
+        return self.reconstructor.current(normalized=True)
+
+    def produce(self, produce):
+        try:
+            self.produced = produce(lambda index, rotation, row: self.rows.put((index, rotation, row)))
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.rows.put(end_of_stream)
+
+    def current(self, normalized=False):
+        return self.reconstructor.current(normalized)
+
+    def filtered_sinogram(self):
+        return np.array([self.filtered[i] for i in sorted(self.filtered)])
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from scipy import sparse
+from skimage.transform import rotate
+
+
+def rotation_source_coords(dim, angle, rows=None):
+    # inverse mapping used by skimage.transform.rotate: output (row, col) -> input (row, col)
+    if rows is None:
+        rows = np.arange(dim)
+    center = dim / 2.0 - 0.5
+    rad = np.deg2rad(angle)
+    cos, sin = np.cos(rad), np.sin(rad)
+    y, x = np.meshgrid(np.asarray(rows, dtype=float), np.arange(dim, dtype=float), indexing='ij')
+    x -= center
+    y -= center
+    src_x = cos * x - sin * y + center
+    src_y = sin * x + cos * y + center
+    return src_y, src_x
+
+
+def bilinear_weights(dim, src_y, src_x):
+    # four neighbours per sample, out of image neighbours are dropped (constant mode, cval=0)
+    y0 = np.floor(src_y).astype(np.int64)
+    x0 = np.floor(src_x).astype(np.int64)
+    dy = src_y - y0
+    dx = src_x - x0
+    neighbours = [(0, 0, (1 - dy) * (1 - dx)), (0, 1, (1 - dy) * dx),
+                  (1, 0, dy * (1 - dx)), (1, 1, dy * dx)]
+    pixels, weights, samples = [], [], []
+    sample_ids = np.arange(src_y.size).reshape(src_y.shape)
+    for oy, ox, w in neighbours:
+        yy = y0 + oy
+        xx = x0 + ox
+        valid = (yy >= 0) & (yy < dim) & (xx >= 0) & (xx < dim) & (w > 0)
+        pixels.append(yy[valid] * dim + xx[valid])
+        weights.append(w[valid])
+        samples.append(sample_ids[valid])
+    return np.concatenate(samples), np.concatenate(pixels), np.concatenate(weights)
+
+
+def angle_operator(tomograph, rotation, real_dim):
+    # same linear map as Tomograph.get_intersection, expressed as (width, dim^2) matrix
+    dim = tomograph.dim
+    rotation = rotation + 90
+    mask = rotate(tomograph.tomograph, rotation).ravel()
+    src_y, src_x = rotation_source_coords(dim, -rotation - 90, tomograph.indexes)
+    samples, pixels, weights = bilinear_weights(dim, src_y, src_x)
+    weights = (weights * mask[pixels] / real_dim).astype(tomograph.dtype)
+    detectors = samples // dim
+    operator = sparse.csr_matrix((weights, (detectors, pixels)), shape=(tomograph.width, dim * dim))
+    operator.eliminate_zeros()
+    return operator
+
+
+def build_system_matrix(tomograph, theta, real_dim):
+    matrix = sparse.vstack([angle_operator(tomograph, rotation, real_dim) for rotation in theta], format='csr')
+    return matrix.astype(tomograph.dtype, copy=False)
+
+
+def system_matrix_key(tomograph, theta, real_dim):
+    return (tomograph.dim, int(tomograph.emitters), tuple(float(t) for t in theta), int(real_dim),
+            tomograph.dtype.str)
+
+
+class SystemMatrixCache:
+    # LRU of sparse operators, key and build take the same (geometry, theta, real_dim) arguments
+
+    def __init__(self, max_size=4, key=system_matrix_key, build=build_system_matrix) -> None:
+        self.max_size = max_size
+        self.key = key
+        self.build = build
+        self.matrices = OrderedDict()
+        self.lock = Lock()
+        self.hits = self.misses = 0
+
+    def get(self, tomograph, theta, real_dim):
+        key = self.key(tomograph, theta, real_dim)
+        with self.lock:
+            if key in self.matrices:
+                self.hits += 1
+                self.matrices.move_to_end(key)
+                return self.matrices[key]
+            self.misses += 1
+        matrix = self.build(tomograph, theta, real_dim)
+        with self.lock:
+            self.matrices[key] = matrix
+            self.matrices.move_to_end(key)
+            while len(self.matrices) > self.max_size:
+                self.matrices.popitem(last=False)
+        return matrix
+
+    def clear(self):
+        with self.lock:
+            self.matrices.clear()
+
+
+system_matrices = SystemMatrixCache()
+
+
+def make_radon_sparse(increased_image, tomograph, real_dim, theta, on_change=None, cache=None, out=None):
+    if cache is None:
+        cache = system_matrices
+    matrix = cache.get(tomograph, theta, real_dim)
+    pixels = np.ravel(increased_image)
+    width = tomograph.width
+    res = np.zeros((len(theta), width), dtype=tomograph.dtype) if out is None else out
+    if on_change is None:
+        res[...] = (matrix @ pixels).reshape(len(theta), width)
+        return res
+    for i in range(len(theta)):
+        res[i] = matrix[i * width:(i + 1) * width] @ pixels
+        on_change(si=res, iter=i)
+    return res
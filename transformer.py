@@ -1,13 +1,35 @@
+import time
 import traceback
+from functools import partial
 
 import matplotlib.pyplot as plt
 import numpy as np
-from numpy.fft import fftfreq, fft, ifft
 from skimage.filters import gaussian
 from skimage.io import imread
-from skimage.transform import rescale, rotate
+from skimage.transform import rescale, resize, rotate
 import warnings
 
+from backprojection import inverse_radon_interpolated, inverse_radon_threaded, default_checkpoints, \
+    add_backprojection, crop_grid
+from batched_projection import make_radon_batched
+from filter_bank import filter_sinograms, windows
+from fourier import reconstruct_fourier
+from hierarchical_backprojection import inverse_radon_hierarchical, default_tolerance
+from iterative import reconstruct_sart
+from metrics import QualityMetrics, available_metrics
+from parallel_projection import make_radon_parallel
+from profiling import null_tracer
+from progress import FramePublisher, downsample
+from pyramid import level_sizes, pyramids
+from siddon import beams, default_spread, inverse_radon_siddon, make_radon_siddon, ray_tables, RayGeometry, \
+    weight_fan_sinogram
+from result_cache import ResultCache, default_cache_dir, default_cache_size, default_checkpoint_budget, \
+    result_key
+from snapshots import SnapshotStore, default_memory_budget
+from storage import WorkDirectory
+from streaming import StreamingPipeline, StreamingReconstructor, projection_source
+from system_matrix import make_radon_sparse
+
 img_name_root = "examples/"
 images = [
     "CT_ScoutView.jpg",
@@ -23,11 +45,14 @@ images = [
 images = [img_name_root + n for n in images]
 
 image_indx = 4
+reconstruction_methods = ("fbp", "sart", "fourier")
+precisions = {"float32": np.float32, "float64": np.float64}
 
 
 class Tomograph:
-    def __init__(self, dim, emitters):
+    def __init__(self, dim, emitters, dtype=np.float64):
         self.dim = int(dim * np.sqrt(2))
+        self.dtype = np.dtype(dtype)
         self.emitters = Tomograph.validate_emitters_num(emitters, dim)
         self.tomograph, self.indexes = self.prepare_tomograph()
         self.width = len(self.indexes)
@@ -46,7 +71,7 @@ class Tomograph:
         return tomo, indexes
 
     def create_filter_at(self, filter):
-        tomo = np.zeros((self.dim, self.dim))
+        tomo = np.zeros((self.dim, self.dim), dtype=self.dtype)
         distance = int(self.dim / self.emitters)
         start = int(distance / 2)
         half_len = len(filter) // 2
@@ -62,44 +87,136 @@ class Tomograph:
         rotated = rotate(self.tomograph, rotation)
         common_part = rotated * image
         common_rotated_again = rotate(common_part, -rotation-90)
-        column_avg = [sum(q) / real_dim for q in common_rotated_again[self.indexes]]
+        column_avg = common_rotated_again[self.indexes].sum(axis=1) / real_dim
         return column_avg
 
 
-class TransformSnapshot:
-
-    def __init__(self, sinogram=None, i_sin=None, square_error=None) -> None:
-        self.sinogram = sinogram
-        self.i_isn = i_sin
-        self.square_error = square_error
-
-
 class Parameters:
 
-    def __init__(self, alpha, emitters_num, use_filter, image_name, use_gauss=True, use_omega=False) -> None:
+    def __init__(self, alpha, emitters_num, use_filter, image_name, use_gauss=True, use_omega=False,
+                 projection="rotate", backprojection="rotate", workers=None,
+                 checkpoints=default_checkpoints, filter_name="ram-lak", reconstruction="fbp",
+                 iterations=10, subsets=10, relaxation=0.5, target_error=None,
+                 snapshot_budget=default_memory_budget, metrics=("mse",), metrics_every=1,
+                 metrics_time_budget=None, metrics_stride=1, streaming=False, work_dir=None,
+                 hierarchy_tolerance=default_tolerance, dtype="float64", scale=0.4, progressive=False,
+                 cache_dir=None, cache_size=default_cache_size, beam="parallel", fan_spread=default_spread) -> None:
         self.alpha = alpha
         self.emitters_num = emitters_num
         self.use_filter = use_filter
         self.image_name = image_name
         self.use_gauss = use_gauss
         self.use_omega = use_omega
-
-    def set_values(self, alpha, emitters_num, use_filter, image_name, use_gauss=True, use_omega=False):
+        self.projection = projection
+        self.backprojection = backprojection
+        self.workers = workers
+        self.checkpoints = checkpoints
+        self.filter_name = filter_name
+        self.reconstruction = reconstruction
+        self.iterations = iterations
+        self.subsets = subsets
+        self.relaxation = relaxation
+        self.target_error = target_error
+        self.snapshot_budget = snapshot_budget
+        self.metrics = metrics
+        self.metrics_every = metrics_every
+        self.metrics_time_budget = metrics_time_budget
+        self.metrics_stride = metrics_stride
+        self.streaming = streaming
+        self.work_dir = work_dir
+        self.hierarchy_tolerance = hierarchy_tolerance
+        self.dtype = dtype
+        self.scale = scale
+        self.progressive = progressive
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.beam = beam
+        self.fan_spread = fan_spread
+
+    def set_values(self, alpha, emitters_num, use_filter, image_name, use_gauss=True, use_omega=False,
+                   projection="rotate", backprojection="rotate", workers=None,
+                   checkpoints=default_checkpoints, filter_name="ram-lak", reconstruction="fbp",
+                   iterations=10, subsets=10, relaxation=0.5, target_error=None,
+                   snapshot_budget=default_memory_budget, metrics=("mse",), metrics_every=1,
+                   metrics_time_budget=None, metrics_stride=1, streaming=False, work_dir=None,
+                   hierarchy_tolerance=default_tolerance, dtype="float64", scale=0.4, progressive=False,
+                   cache_dir=None, cache_size=default_cache_size, beam="parallel", fan_spread=default_spread):
         if alpha <= 0:
             raise Exception("Alpha must be positive")
         if emitters_num <= 0:
             raise Exception("Emitters num must be positive")
         if image_name is None:
             raise Exception("Image was not selected")
+        if projection not in projection_engines:
+            raise Exception("Unknown projection engine " + str(projection))
+        if backprojection not in backprojection_engines:
+            raise Exception("Unknown backprojection engine " + str(backprojection))
+        if workers is not None and workers <= 0:
+            raise Exception("Workers num must be positive")
+        if checkpoints <= 0:
+            raise Exception("Checkpoints num must be positive")
+        if filter_name not in windows:
+            raise Exception("Unknown filter " + str(filter_name))
+        if reconstruction not in reconstruction_methods:
+            raise Exception("Unknown reconstruction " + str(reconstruction))
+        if iterations <= 0 or subsets <= 0:
+            raise Exception("Iterations and subsets num must be positive")
+        if relaxation <= 0:
+            raise Exception("Relaxation must be positive")
+        if any(m not in available_metrics for m in metrics):
+            raise Exception("Unknown metrics " + str(metrics))
+        if metrics_every <= 0 or metrics_stride <= 0:
+            raise Exception("Metrics cadence and stride must be positive")
+        if hierarchy_tolerance < 0:
+            raise Exception("Hierarchy tolerance must not be negative")
+        if dtype not in precisions:
+            raise Exception("Unknown dtype " + str(dtype))
+        if scale <= 0:
+            raise Exception("Scale must be positive")
+        if cache_size <= 0:
+            raise Exception("Cache size must be positive")
+        if beam not in beams:
+            raise Exception("Unknown beam " + str(beam))
+        if not 0 < fan_spread < 360:
+            raise Exception("Fan spread must be between 0 and 360 degrees")
+        # only the ray-driven engines know the fan geometry
+        if beam == "fan" and (projection != "siddon" or streaming or reconstruction == "fourier" or
+                              (reconstruction == "fbp" and backprojection != "siddon")):
+            raise Exception("Fan beam needs siddon projection and siddon backprojection or SART")
         self.alpha = alpha
         self.emitters_num = emitters_num
         self.use_filter = use_filter
         self.image_name = image_name
         self.use_gauss = use_gauss
         self.use_omega = use_omega
-
-
-params = Parameters(180 / 360, 10, True, images[image_indx])
+        self.projection = projection
+        self.backprojection = backprojection
+        self.workers = workers
+        self.checkpoints = checkpoints
+        self.filter_name = filter_name
+        self.reconstruction = reconstruction
+        self.iterations = iterations
+        self.subsets = subsets
+        self.relaxation = relaxation
+        self.target_error = target_error
+        self.snapshot_budget = snapshot_budget
+        self.metrics = metrics
+        self.metrics_every = metrics_every
+        self.metrics_time_budget = metrics_time_budget
+        self.metrics_stride = metrics_stride
+        self.streaming = streaming
+        self.work_dir = work_dir
+        self.hierarchy_tolerance = hierarchy_tolerance
+        self.dtype = dtype
+        self.scale = scale
+        self.progressive = progressive
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.beam = beam
+        self.fan_spread = fan_spread
+
+
+params = Parameters(180 / 360, 10, True, images[image_indx], cache_dir=default_cache_dir)
 
 
 def draw_image(i, img):
@@ -107,6 +224,10 @@ def draw_image(i, img):
     plt.imshow(img, cmap=plt.cm.Greys_r)
 
 
+def float_dtype(img):
+    return img.dtype if np.issubdtype(img.dtype, np.floating) else np.dtype(np.float64)
+
+
 def make_image_square(img):
     shape = img.shape
     if len(shape) != 2:
@@ -121,7 +242,7 @@ def make_image_square(img):
 
 
 def pad_image(img, required_size, shape):
-    result = np.zeros((required_size, required_size))
+    result = np.zeros((required_size, required_size), dtype=float_dtype(img))
     start_x = int((required_size - shape[0]) / 2)
     start_y = int((required_size - shape[1]) / 2)
     end_x = start_x + shape[0]
@@ -136,8 +257,8 @@ def increase_image(img):
     return pad_image(img, int(np_max_dim * np.sqrt(2)), shape)
 
 
-def make_radon(increased_image, tomograph, real_dim, theta, on_change=None):
-    res = np.zeros((len(theta), tomograph.width))
+def make_radon(increased_image, tomograph, real_dim, theta, on_change=None, out=None):
+    res = np.zeros((len(theta), tomograph.width), dtype=tomograph.dtype) if out is None else out
     for i, rotation in enumerate(theta):
         res[i] = tomograph.get_intersection(rotation, increased_image, real_dim)
         if on_change is not None:
@@ -145,22 +266,30 @@ def make_radon(increased_image, tomograph, real_dim, theta, on_change=None):
     return res
 
 
-def transform_sinogram(params, sinogram):
-    sinogram = np.rot90(sinogram, k=1)
-    freqs = sinogram.shape[0]
-    projection_size_padded = \
-        max(64, int(2 ** np.ceil(np.log2(2 * freqs))))
-    pad_width = ((0, projection_size_padded - freqs), (0, 0))
-    img = np.pad(sinogram, pad_width, mode='constant', constant_values=0)
-    f = fftfreq(projection_size_padded).reshape(-1, 1)
-    omega = 2 * np.pi * f
-    fourier_filter = 2 * np.abs(f)
-    if params.use_omega:
-        fourier_filter *= np.cos(omega)
-    projection = fft(img, axis=0) * fourier_filter
-    radon_filtered = np.real(ifft(projection, axis=0))
-    radon_filtered = radon_filtered[:freqs, :]
-    return np.rot90(radon_filtered, k=-1)
+projection_engines = {
+    "rotate": make_radon,
+    "sparse": make_radon_sparse,
+    "batched": make_radon_batched,
+    "parallel": make_radon_parallel,
+    "siddon": make_radon_siddon,
+}
+
+
+def project(params, increased_image, tomograph, real_dim, theta, on_change=None, out=None):
+    if params.projection == "parallel":
+        return make_radon_parallel(increased_image, tomograph, real_dim, theta, on_change=on_change,
+                                   workers=params.workers, out=out)
+    if params.projection == "siddon":
+        return make_radon_siddon(increased_image, tomograph, real_dim, theta, on_change=on_change, beam=params.beam,
+                                 spread=params.fan_spread, out=out)
+    engine = projection_engines[params.projection]
+    return engine(increased_image, tomograph, real_dim, theta, on_change=on_change, out=out)
+
+
+def transform_sinogram(params, sinogram, tomograph=None):
+    if params.beam == "fan":
+        sinogram = weight_fan_sinogram(sinogram, tomograph, params.fan_spread)
+    return filter_sinograms(sinogram, params.filter_name, params.use_omega)
 
 
 def norm(mat):
@@ -172,15 +301,15 @@ def norm(mat):
     return mat
 
 
-def inverse_radon(sigmoid, rotations, output_size, tomograph, on_change=None):
-    reconstructed = increase_image(np.zeros((output_size, output_size)))
+def inverse_radon(sigmoid, rotations, output_size, tomograph, on_change=None, out=None):
+    reconstructed = increase_image(np.zeros((output_size, output_size), dtype=tomograph.dtype))
     reconstr_len = len(reconstructed)
     start = (reconstr_len - output_size) // 2
     end = start + output_size
     rotations_len = len(rotations)
     result = reconstructed[start:end, start:end]
     for i in range(rotations_len):
-        temp = np.zeros(tomograph.dim)
+        temp = np.zeros(tomograph.dim, dtype=tomograph.dtype)
         temp[tomograph.indexes] = sigmoid[i]
         temp = np.array([temp, ] * reconstr_len)
         temp = make_image_square(temp)
@@ -190,9 +319,48 @@ def inverse_radon(sigmoid, rotations, output_size, tomograph, on_change=None):
             on_change(isi=result, iter=i)
 
     result = norm(result)
+    if out is not None:
+        out[...] = result
+        return out
     return result
 
 
+backprojection_engines = {
+    "rotate": inverse_radon,
+    "interpolate": inverse_radon_interpolated,
+    "threaded": inverse_radon_threaded,
+    "hierarchical": inverse_radon_hierarchical,
+    "siddon": inverse_radon_siddon,
+}
+
+
+def back_project(params, sinogram, rotations, output_size, tomograph, on_change=None, out=None):
+    if params.backprojection == "threaded":
+        return inverse_radon_threaded(sinogram, rotations, output_size, tomograph, on_change=on_change,
+                                      workers=params.workers, checkpoints=params.checkpoints, out=out)
+    if params.backprojection == "hierarchical":
+        return inverse_radon_hierarchical(sinogram, rotations, output_size, tomograph, on_change=on_change,
+                                          tolerance=params.hierarchy_tolerance, out=out)
+    if params.backprojection == "siddon":
+        return inverse_radon_siddon(sinogram, rotations, output_size, tomograph, on_change=on_change,
+                                    beam=params.beam, spread=params.fan_spread, out=out)
+    engine = backprojection_engines[params.backprojection]
+    return engine(sinogram, rotations, output_size, tomograph, on_change=on_change, out=out)
+
+
+def iterative_matrix(params, tomograph, rotations, output_size):
+    # SART reuses the ray tables of the siddon projector, otherwise the rotation system matrix
+    if params.projection != "siddon":
+        return None
+    return ray_tables.get(RayGeometry(tomograph, params.beam, params.fan_spread), rotations, output_size)
+
+
+def reconstruct_direct(params, sinogram, rotations, output_size, tomograph, on_change=None, out=None):
+    return reconstruct_fourier(sinogram, rotations, output_size, tomograph, on_change=on_change,
+                               use_filter=params.use_filter, filter_name=params.filter_name,
+                               use_omega=params.use_omega, out=out)
+
+
 def get_moves(a):
     return [a * i for i in range(int(np.ceil(180 / a)))]
 
@@ -205,20 +373,20 @@ def show_images(original, sinogram, reconstructed):
     plt.show()
 
 
-def transform_sinogram_if_enabled(params, sinogram):
+def transform_sinogram_if_enabled(params, sinogram, tomograph=None):
     if params.use_filter:
-        return transform_sinogram(params, sinogram)
+        return transform_sinogram(params, sinogram, tomograph)
     else:
         return sinogram
 
 
-def read_image(name):
+def read_image(name, scale=0.4):
     image = imread(name, as_grey=True)
-    return normalize_img(image)
+    return normalize_img(image, scale)
 
 
-def normalize_img(image):
-    image = rescale(image, scale=0.4, mode='reflect')
+def normalize_img(image, scale=0.4):
+    image = rescale(image, scale=scale, mode='reflect')
     max_image_value = np.max(image)
     if max_image_value > 1:
         image /= 255
@@ -228,8 +396,8 @@ def normalize_img(image):
 def prepare_instance(params, image=None):
     theta = get_moves(params.alpha)
     if image is None:
-        image = read_image(params.image_name)
-    image = make_image_square(image)
+        image = read_image(params.image_name, params.scale)
+    image = make_image_square(np.asarray(image, dtype=precisions[params.dtype]))
     return image, theta
 
 
@@ -243,89 +411,321 @@ def get_medium_squared_error(original, reconstructed):
             reconstructed_copy /= (rec_copy_max / org_copy_max)
         dif = original_copy - reconstructed_copy
         dif **= 2
-        return dif.sum() / dif.size
+        return float(dif.sum() / dif.size)
     else:
         return 0
 
 
+def cached_tomograph(emitters, dim, dtype=np.float64):
+    # tomographs are never modified after construction, so scans of the same geometry share one
+    return pyramids.geometry(("tomograph", int(dim), int(emitters), np.dtype(dtype).str),
+                             lambda: Tomograph(emitters=emitters, dim=dim, dtype=dtype))
+
+
+def preview_level(params, image, full_size, max_alpha=10.0):
+    # whole scan/filter/backprojection on a pyramid level, angles and emitters shrink with the level
+    factor = full_size / len(image)
+    alpha = min(params.alpha * factor, max(params.alpha, max_alpha))
+    emitters = int(max(1, min(len(image), round(params.emitters_num / factor))))
+    tomograph = cached_tomograph(emitters, len(image), precisions[params.dtype])
+    theta = get_moves(alpha)
+    sinogram = make_radon_batched(increase_image(image), tomograph, len(image), theta)
+    if params.reconstruction == "fourier":
+        return sinogram, reconstruct_direct(params, sinogram, theta, len(image), tomograph)
+    # previews always scan with parallel rays, so fan weighting does not apply here
+    filtered = filter_sinograms(sinogram, params.filter_name, params.use_omega) if params.use_filter else sinogram
+    return sinogram, inverse_radon_interpolated(filtered, theta, len(image), tomograph)
+
+
+def resize_preview(image, shape):
+    return resize(image, shape, order=1, mode='edge', anti_aliasing=False,
+                  preserve_range=True).astype(image.dtype, copy=False)
+
+
 class Scanner:
     update_time = 0.2
 
-    def __init__(self, params, plot, image, on_finish=lambda: None) -> None:
+    def __init__(self, params, plot, image, on_finish=lambda: None, tracer=None, on_trace=None) -> None:
         self.params = params
-        self.image, self.theta = prepare_instance(params, image)
-        self.increased_image = increase_image(self.image)
-        self.tomograph = Tomograph(emitters=params.emitters_num, dim=np.max(self.image.shape))
+        self.tracer = null_tracer if tracer is None else tracer
+        self.on_trace = on_trace
+        self.tracer.start()
+        # out-of-core mode keeps the padded image, sinograms, reconstruction and checkpoints in .npy memmaps
+        self.work = None if params.work_dir is None else WorkDirectory(params.work_dir)
+        with self.tracer.stage("prepare_instance"):
+            self.image, self.theta = prepare_instance(params, image)
+        with self.tracer.stage("increase_image"):
+            self.increased_image = increase_image(self.image)
+            if self.work is not None:
+                self.increased_image = self.work.store("increased_image", self.increased_image)
+        with self.tracer.stage("prepare_tomograph", emitters=int(params.emitters_num)):
+            self.tomograph = cached_tomograph(params.emitters_num, np.max(self.image.shape), precisions[params.dtype])
         self.sinogram = None
         self.sinogram_transformed = None
         self.i_sin = None
         self.square_error = 0
-        self.refresh_sinogram = self.refresh_isin = False
         self.on_finish = on_finish
         self.plot = plot
-        self.snapshots = [TransformSnapshot() for _ in self.theta]
+        self.publisher = FramePublisher(self.update_time, plot.get_display_shape())
+        # hierarchical backprojection reports whole quadrants and siddon traces rays instead of smearing,
+        # so neither can be replayed with add_backprojection
+        replay = None
+        if params.reconstruction == "fbp" and params.backprojection not in ("hierarchical", "siddon"):
+            replay = self.replay_backprojection
+        self.snapshots = SnapshotStore(len(self.theta), replay=replay, memory_budget=params.snapshot_budget,
+                                       work=self.work)
+        self.i_sin_iter = -1
         self.errors_history = []
+        self.metrics = None
+        if params.metrics:
+            self.metrics = QualityMetrics(self.image, params.metrics, every=params.metrics_every,
+                                          time_budget=params.metrics_time_budget, stride=params.metrics_stride)
+        self.quality = {}
+        self.pipeline = None
+        # set by jobs.JobPool.submit, checked between angles
+        self.job = None
+        self.cache = None if params.cache_dir is None else ResultCache(params.cache_dir, params.cache_size)
+        self.cache_key = None
+        self.cached = False
+        if self.cache is not None:
+            with self.tracer.stage("cache_key"):
+                self.cache_key = result_key(self.image, params)
+
+    def replay_backprojection(self, frame, begin, end):
+        grid = crop_grid(self.tomograph.dim, len(self.image), self.tomograph.dtype)
+        for i in range(begin, end):
+            add_backprojection(frame, self.sinogram_transformed[i], self.theta[i], self.tomograph, grid)
 
     def get_snapshot(self, i):
         try:
             i = int(i / 99 * (len(self.theta) - 1))
-            snap = self.snapshots[i]
+            snap = self.snapshots.get(i)
             self.i_sin = snap.i_isn
             self.sinogram = snap.sinogram
-            self.refresh_sinogram = True
             self.square_error = snap.square_error
             self.get_errors_history_to_iteration(i, False)
-            self.refresh_isin = True
+            if self.sinogram is not None:
+                self.publisher.publish("sinogram", self.sinogram, force=True)
+            if self.i_sin is not None:
+                self.publisher.publish("i_sin", self.i_sin, self.square_error, force=True)
         except Exception:
             traceback.print_exc()
 
+    def progress(self):
+        # projected rows and reconstructed angles, both count towards completion
+        done = self.snapshots.sinogram_iter + 1 + self.snapshots.last_iter + 1
+        return min(1.0, done / (2.0 * len(self.theta)))
+
     def get_errors_history_to_iteration(self, i, append_mode=True):
         if append_mode:
-            self.errors_history.append(self.snapshots[i].square_error)
+            self.errors_history.append(self.snapshots.square_error(i))
         else:
-            self.errors_history = [s.square_error for s in self.snapshots[:i]]
+            self.errors_history = self.snapshots.errors_to(i)
 
     def assign(self, si=None, isi=None, tisi=None, iter=None):
+        if self.job is not None:
+            self.job.check()
+        last = iter is None or iter == len(self.theta) - 1
         if si is not None:
             if self.sinogram is None:
-                self.sinogram = si
-                self.plot.on_sinogram(si)
-            else:
-                self.sinogram = si
+                self.plot.on_sinogram(downsample(si, self.publisher.display_shape))
+            self.sinogram = si
             if iter is not None:
-                self.snapshots[iter].sinogram = np.array(si)
-            self.refresh_sinogram = True
+                with self.tracer.angle_stage("sinogram_snapshot", iter):
+                    self.snapshots.add_sinogram(si, iter)
+            self.publisher.publish("sinogram", si, force=last)
         if isi is not None:
             if self.i_sin is None:
-                self.i_sin = isi
-                self.plot.on_isinogram(isi)
-            else:
-                self.i_sin = isi
-            if iter is not None:
-                self.snapshots[iter].i_isn = np.array(isi)
-                self.square_error = get_medium_squared_error(self.image, isi)
-                self.snapshots[iter].square_error = self.square_error
-                self.get_errors_history_to_iteration(iter)
-            self.refresh_isin = True
+                self.plot.on_isinogram(downsample(isi, self.publisher.display_shape))
+            self.i_sin = isi
+            if iter is not None and self.metrics is None:
+                with self.tracer.angle_stage("reconstruction_snapshot", iter):
+                    self.snapshots.add_reconstruction(isi, iter, None)
+            elif iter is not None:
+                if self.metrics.due(iter, len(self.theta) - 1):
+                    with self.tracer.angle_stage("metrics", iter):
+                        self.quality = self.metrics.evaluate(isi)
+                    self.square_error = self.quality["mse"]
+                with self.tracer.angle_stage("reconstruction_snapshot", iter):
+                    self.snapshots.add_reconstruction(isi, iter, self.square_error)
+                # threaded backprojection reports only at checkpoints
+                for i in range(self.i_sin_iter + 1, iter + 1):
+                    self.get_errors_history_to_iteration(i)
+                self.i_sin_iter = iter
+            self.publisher.publish("i_sin", isi, self.square_error, force=last)
         if tisi is not None:
             self.sinogram_transformed = tisi
 
     def watch_changes(self):
         self.plot.on_new_scan(self.image, len(self.theta))
-        sinogram = make_radon(self.increased_image, self.tomograph,
-                              len(self.image), self.theta, on_change=self.assign)
-        sinogram_transformed = transform_sinogram_if_enabled(self.params, sinogram)
-        self.assign(tisi=sinogram_transformed)
-        i_sin = inverse_radon(sinogram_transformed, self.theta, len(self.image), self.tomograph, on_change=self.assign)
+        if self.cache is not None:
+            with self.tracer.stage("cache_lookup"):
+                self.cached = self.load_cached()
+            if self.cached:
+                self.finish()
+                return
+        if self.params.progressive:
+            self.preview()
+        if self.params.streaming and self.params.reconstruction == "fbp":
+            with self.tracer.stage("streaming", engine=self.params.projection, angles=len(self.theta)):
+                self.reconstruct_streaming()
+            self.finish()
+            return
+        with self.tracer.stage("projection", engine=self.params.projection, angles=len(self.theta)):
+            sinogram_out = self.allocate("sinogram", (len(self.theta), self.tomograph.width))
+            sinogram = project(self.params, self.increased_image, self.tomograph, len(self.image), self.theta,
+                               on_change=self.assign, out=sinogram_out)
+        if self.params.reconstruction == "sart":
+            with self.tracer.stage("reconstruction", engine="sart"):
+                self.keep("reconstruction", self.reconstruct_iteratively(sinogram))
+        elif self.params.reconstruction == "fourier":
+            with self.tracer.stage("reconstruction", engine="fourier"):
+                reconstruct_direct(self.params, sinogram, self.theta, len(self.image), self.tomograph,
+                                   on_change=self.assign, out=self.allocate("reconstruction", self.image.shape))
+        else:
+            with self.tracer.stage("filter", filter=self.params.filter_name, enabled=self.params.use_filter):
+                sinogram_transformed = self.keep("sinogram_filtered",
+                                                 transform_sinogram_if_enabled(self.params, sinogram, self.tomograph))
+            self.assign(tisi=sinogram_transformed)
+            with self.tracer.stage("backprojection", engine=self.params.backprojection):
+                i_sin = back_project(self.params, sinogram_transformed, self.theta, len(self.image), self.tomograph,
+                                     on_change=self.assign, out=self.allocate("reconstruction", self.image.shape))
+        self.finish()
+
+    def preview(self):
+        # coarse to fine levels are shown before the full resolution scan starts
+        sizes = level_sizes(len(self.image))
+        for size, level in zip(sizes, pyramids.levels(self.image, sizes)):
+            if self.job is not None:
+                self.job.check()
+            with self.tracer.stage("preview", size=size):
+                sinogram, i_sin = preview_level(self.params, level, len(self.image))
+                self.show_preview(sinogram, i_sin, get_medium_squared_error(level, i_sin))
+
+    def show_preview(self, sinogram, i_sin, square_error):
+        sinogram = resize_preview(sinogram, (len(self.theta), self.tomograph.width))
+        i_sin = resize_preview(i_sin, self.image.shape)
+        self.show_result(sinogram, i_sin, square_error)
+
+    def show_result(self, sinogram, i_sin, square_error):
+        if self.sinogram is None:
+            self.plot.on_sinogram(downsample(sinogram, self.publisher.display_shape))
+        if self.i_sin is None:
+            self.plot.on_isinogram(downsample(i_sin, self.publisher.display_shape))
+        self.sinogram, self.i_sin, self.square_error = sinogram, i_sin, square_error
+        self.publisher.publish("sinogram", sinogram, force=True)
+        self.publisher.publish("i_sin", i_sin, square_error, force=True)
+
+    def load_cached(self):
+        arrays, metadata = self.cache.load(self.cache_key)
+        if arrays is None:
+            return False
+        self.snapshots.restore(arrays)
+        self.quality = metadata["quality"]
+        self.errors_history = self.snapshots.errors_to(len(self.theta))
+        self.i_sin_iter = len(self.theta) - 1
+        if "sinogram_filtered" in arrays:
+            self.assign(tisi=self.keep("sinogram_filtered", arrays["sinogram_filtered"]))
+        self.show_result(self.keep("sinogram", arrays["sinogram"]),
+                         self.keep("reconstruction", arrays["reconstruction"]), metadata["square_error"])
+        return True
+
+    def store_cached(self):
+        arrays = self.snapshots.export(default_checkpoint_budget)
+        arrays.update(sinogram=self.sinogram, reconstruction=self.current_reconstruction())
+        if self.sinogram_transformed is not self.sinogram:
+            arrays["sinogram_filtered"] = self.sinogram_transformed
+        self.cache.store(self.cache_key, arrays, dict(
+            square_error=float(self.square_error), angles=len(self.theta),
+            quality={name: float(value) for name, value in self.quality.items()}))
+
+    def allocate(self, name, shape):
+        if self.work is None:
+            return None
+        return self.work.create(name, shape, self.tomograph.dtype)
+
+    def keep(self, name, array):
+        if self.work is None:
+            return array
+        return self.work.store(name, array)
+
+    def finish(self):
+        if self.cache is not None and not self.cached:
+            with self.tracer.stage("cache_store"):
+                self.store_cached()
+        if self.work is not None:
+            self.work.save_metadata(dict(vars(self.params), theta=list(self.theta)))
+        self.tracer.finish()
+        if self.on_trace is not None:
+            self.on_trace(self.tracer)
         self.on_finish()
 
-
-if __name__ == "__main__":
-    image, theta = prepare_instance(params)
+    def reconstruct_streaming(self):
+        # every sinogram row is filtered and backprojected while the scan is still running
+        reconstructor = StreamingReconstructor(self.tomograph, len(self.image), self.params.use_filter,
+                                               self.params.filter_name, self.params.use_omega)
+        self.pipeline = StreamingPipeline(reconstructor)
+        sinogram_out = self.allocate("sinogram", (len(self.theta), self.tomograph.width))
+        source = projection_source(partial(project, self.params, out=sinogram_out), self.increased_image,
+                                   self.tomograph, len(self.image), self.theta, on_change=self.assign)
+        i_sin = self.pipeline.run(source, on_row=lambda i: self.assign(isi=reconstructor.accumulator, iter=i))
+        self.assign(tisi=self.keep("sinogram_filtered", self.pipeline.filtered_sinogram()))
+        return self.keep("reconstruction", i_sin)
+
+    def current_reconstruction(self):
+        if self.pipeline is not None:
+            return self.pipeline.current(normalized=True)
+        return self.i_sin
+
+    def assign_iteration(self, isi=None, iter=None):
+        # iterative sweeps are spread over the per-angle snapshot slots
+        slots = len(self.theta)
+        self.assign(isi=isi, iter=min(slots, (iter + 1) * slots // self.params.iterations) - 1)
+
+    def reconstruct_iteratively(self, sinogram):
+        i_sin = reconstruct_sart(sinogram, self.theta, len(self.image), self.tomograph,
+                                 on_change=self.assign_iteration, iterations=self.params.iterations,
+                                 subsets=self.params.subsets, relaxation=self.params.relaxation,
+                                 error_of=lambda result: get_medium_squared_error(self.image, result),
+                                 target_error=self.params.target_error,
+                                 matrix=iterative_matrix(self.params, self.tomograph, self.theta, len(self.image)))
+        if self.snapshots.last_iter < len(self.theta) - 1:
+            self.assign(isi=i_sin, iter=len(self.theta) - 1)
+        return i_sin
+
+
+def run_pipeline(params, image=None, timings=None):
+    # headless scan + reconstruction, optional timings dict is filled with per stage seconds
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+    image, theta = prepare_instance(params, image)
     increased_image = increase_image(image)
-    tomograph = Tomograph(emitters=params.emitters_num, dim=np.max(image.shape))
-    sinogram = make_radon(increased_image, tomograph, len(image), theta)
-    sinogram_transformed = transform_sinogram_if_enabled(params, sinogram)
-    i_sin = inverse_radon(sinogram_transformed, theta, len(image), tomograph)
+    tomograph = cached_tomograph(params.emitters_num, np.max(image.shape), precisions[params.dtype])
+    timings["prepare"] = time.perf_counter() - start
+    start = time.perf_counter()
+    sinogram = project(params, increased_image, tomograph, len(image), theta)
+    timings["project"] = time.perf_counter() - start
+    start = time.perf_counter()
+    if params.reconstruction == "sart":
+        sinogram_transformed = sinogram
+        timings["filter"] = 0.0
+        i_sin = reconstruct_sart(sinogram, theta, len(image), tomograph, iterations=params.iterations,
+                                 subsets=params.subsets, relaxation=params.relaxation,
+                                 matrix=iterative_matrix(params, tomograph, theta, len(image)))
+    elif params.reconstruction == "fourier":
+        sinogram_transformed = sinogram
+        timings["filter"] = 0.0
+        i_sin = reconstruct_direct(params, sinogram, theta, len(image), tomograph)
+    else:
+        sinogram_transformed = transform_sinogram_if_enabled(params, sinogram, tomograph)
+        timings["filter"] = time.perf_counter() - start
+        start = time.perf_counter()
+        i_sin = back_project(params, sinogram_transformed, theta, len(image), tomograph)
+    timings["reconstruct"] = time.perf_counter() - start
+    return image, sinogram, sinogram_transformed, i_sin
 
+
+if __name__ == "__main__":
+    image, sinogram, sinogram_transformed, i_sin = run_pipeline(params)
     show_images(image, sinogram, i_sin)
@@ -0,0 +1,139 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pydicom
+
+import dicom_creator
+import transformer as tr
+from filter_bank import filter_sinograms
+from system_matrix import system_matrices
+
+dicom_extensions = (".dc3", ".dcm", ".dic")
+worker_state = {}
+
+
+def slice_position(ds):
+    if "ImagePositionPatient" in ds:
+        return float(ds.ImagePositionPatient[2])
+    if "InstanceNumber" in ds:
+        return float(ds.InstanceNumber)
+    return 0.0
+
+
+def read_series(path):
+    # a directory of single frame files or one multi frame dataset
+    if os.path.isdir(path):
+        names = sorted(os.path.join(path, n) for n in os.listdir(path) if n.lower().endswith(dicom_extensions))
+        datasets = sorted((pydicom.dcmread(n, force=True) for n in names), key=slice_position)
+        return datasets, np.stack([ds.pixel_array for ds in datasets]).astype(float)
+    ds = pydicom.dcmread(path, force=True)
+    pixels = ds.pixel_array.astype(float)
+    if pixels.ndim == 2:
+        pixels = pixels[np.newaxis]
+    return [ds] * len(pixels), pixels
+
+
+def prepare_slices(pixels, scale=0.4):
+    # one intensity scale for the whole volume, so slices stay comparable
+    pixels = pixels - pixels.min()
+    if pixels.max() > 0:
+        pixels /= pixels.max()
+    return np.stack([tr.make_image_square(tr.normalize_img(p, scale)) for p in pixels])
+
+
+class VolumeGeometry:
+    # shared by every slice: angles, tomograph and (for the sparse engine) the system matrix
+
+    def __init__(self, params, slice_shape) -> None:
+        self.theta = tr.get_moves(params.alpha)
+        self.real_dim = int(np.max(slice_shape))
+        self.tomograph = tr.Tomograph(emitters=params.emitters_num, dim=self.real_dim,
+                                      dtype=tr.precisions[params.dtype])
+        self.matrix = None
+        if params.projection == "sparse":
+            self.matrix = system_matrices.get(self.tomograph, self.theta, self.real_dim)
+
+    def __getstate__(self):
+        # workers only backproject per slice, the projection matrix stays in the main process
+        return dict(self.__dict__, matrix=None)
+
+
+def init_worker(params, geometry):
+    worker_state["params"] = params
+    worker_state["geometry"] = geometry
+
+
+def project_slice(image):
+    params = worker_state["params"]
+    geometry = worker_state["geometry"]
+    return tr.project(params, tr.increase_image(image), geometry.tomograph, geometry.real_dim, geometry.theta)
+
+
+def back_project_slice(sinogram):
+    params = worker_state["params"]
+    geometry = worker_state["geometry"]
+    return tr.back_project(params, sinogram, geometry.theta, geometry.real_dim, geometry.tomograph)
+
+
+def project_volume(params, geometry, slices, executor):
+    if geometry.matrix is not None:
+        # one sparse mat-mat for the whole stack
+        increased = np.stack([tr.increase_image(s) for s in slices]).reshape(len(slices), -1)
+        return (geometry.matrix @ increased.T).T.reshape(len(slices), len(geometry.theta), -1)
+    return np.stack(list(executor.map(project_slice, slices)))
+
+
+def reconstruct_volume(params, slices, workers=None):
+    slices = np.asarray(slices, dtype=tr.precisions[params.dtype])
+    geometry = VolumeGeometry(params, slices.shape[1:])
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(params, geometry)) as executor:
+        sinograms = project_volume(params, geometry, slices, executor)
+        if params.use_filter:
+            sinograms = filter_sinograms(sinograms, params.filter_name, params.use_omega)
+        reconstructions = np.stack(list(executor.map(back_project_slice, sinograms)))
+    return sinograms, reconstructions
+
+
+def write_series(reconstructions, datasets, output_dir, description="Radon reconstruction"):
+    return dicom_creator.write_series(reconstructions, output_dir, templates=datasets, description=description)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruct a DICOM series slice by slice with shared geometry")
+    parser.add_argument("series", help="directory of DICOM files or a multi-frame DICOM file")
+    parser.add_argument("output", help="directory for the reconstructed series")
+    parser.add_argument("--alpha", type=float, default=tr.params.alpha)
+    parser.add_argument("--emitters", type=int, default=tr.params.emitters_num)
+    parser.add_argument("--scale", type=float, default=0.4)
+    parser.add_argument("--filter", default="ram-lak", choices=sorted(tr.windows))
+    parser.add_argument("--no-filter", action="store_true")
+    parser.add_argument("--projection", default="batched", choices=sorted(tr.projection_engines))
+    parser.add_argument("--backprojection", default="interpolate", choices=sorted(tr.backprojection_engines))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dtype", default="float64", choices=sorted(tr.precisions))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = tr.Parameters(args.alpha, args.emitters, not args.no_filter, args.series)
+    params.set_values(args.alpha, args.emitters, not args.no_filter, args.series, projection=args.projection,
+                      backprojection=args.backprojection, filter_name=args.filter, dtype=args.dtype)
+    datasets, pixels = read_series(args.series)
+    slices = prepare_slices(pixels, args.scale)
+    _, reconstructions = reconstruct_volume(params, slices, args.workers)
+    names = write_series(reconstructions, datasets, args.output)
+    print("Wrote %d slices to %s" % (len(names), args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())